@@ -0,0 +1,232 @@
+#  IBM Confidential
+#  OCO Source Materials
+#  5737-B37, 5737-C49, 5737-H76
+#  (C) Copyright IBM Corp. 2024 All Rights Reserved.
+#  The source code for this program is not published or
+#  otherwise divested of its trade secrets, irrespective of
+#  what has been deposited with the U.S. Copyright Office.
+
+# Scaling benchmark for the hazard analysis in find_nodes.py.
+#
+# Generates synthetic flows of growing size and measures the runtime and the
+# peak memory of analyzing them.
+#
+# Usage:
+#   python bench_find_nodes.py [--shapes chain,diamond,fanin,random,nested] [--sizes 100,1000,5000]
+#                              [--density 0.002] [--repeat 3] [--output results.csv] [--write-flows <dir>]
+#
+# Example:
+#   python bench_find_nodes.py --sizes 500,2000,10000 --output bench.csv
+
+import os
+import csv
+import json
+import random
+import argparse
+import tracemalloc
+import time
+
+import find_nodes
+
+SHAPES = ["chain", "diamond", "fanin", "random", "nested"]
+DEFAULT_SIZES = "100,1000,5000"
+FANIN_WIDTH = 16
+NESTED_REFS = 4
+
+#############################
+
+
+def make_node(nid, component, links=(), inputs=()):
+    node = {
+        "id": nid,
+        "type": "execution_node",
+        "op": component,
+        "app_data": {
+            "pipeline_data": {
+                "name": nid,
+                "descriptive_name": f"Node {nid}",
+                "config": {"link": {"component_id_ref": component}},
+                "inputs": list(inputs),
+                "outputs": [{"name": "result"}]
+            },
+            "ui_data": {"x_pos": 0, "y_pos": 0}
+        },
+        "inputs": [{"id": "inPort"}],
+        "outputs": [{"id": "outPort"}]
+    }
+    if links:
+        node["inputs"][0]["links"] = [
+            {"id": f"{prev}_{nid}", "node_id_ref": prev, "port_id_ref": "outPort"} for prev in links
+        ]
+    return node
+
+
+def ref_input(name, refs):
+    expression = " + ".join(f"tasks.{ref}.results.result" for ref in refs)
+    return {"name": name, "value_from": {"expression": expression}}
+
+
+def gen_chain(size, rnd, density):
+    nodes = [make_node("n0", "run-job")]
+    for i in range(1, size):
+        nodes.append(make_node(f"n{i}", "run-job", [f"n{i - 1}"], [ref_input("in", ["n0"])]))
+    return nodes
+
+
+def gen_diamond(size, rnd, density):
+    nodes = [make_node("n0", "run-job")]
+    prev = "n0"
+    i = 1
+    while i + 3 <= size:
+        left, right, join = f"n{i}", f"n{i + 1}", f"n{i + 2}"
+        component = "wait-sequencer-any" if rnd.random() < 0.1 else "wait-sequencer-all"
+        nodes.append(make_node(left, "run-job", [prev]))
+        nodes.append(make_node(right, "run-job", [prev]))
+        nodes.append(make_node(join, component, [left, right], [ref_input("in", ["n0"])]))
+        prev = join
+        i += 3
+    return nodes
+
+
+def gen_fanin(size, rnd, density):
+    nodes = [make_node("n0", "run-job")]
+    prev = "n0"
+    producer = "n0"
+    i = 1
+    while i + FANIN_WIDTH + 1 <= size:
+        layer = [f"n{i + k}" for k in range(FANIN_WIDTH)]
+        for nid in layer:
+            # Consume an output from the previous layer, i.e. across the wait-any join
+            nodes.append(make_node(nid, "run-job", [prev], [ref_input("in", [producer])]))
+        producer = layer[0]
+        join = f"n{i + FANIN_WIDTH}"
+        nodes.append(make_node(join, "wait-sequencer-any", layer))
+        prev = join
+        i += FANIN_WIDTH + 1
+    return nodes
+
+
+def gen_random(size, rnd, density):
+    nodes = [make_node("n0", "run-job")]
+    for i in range(1, size):
+        count = max(1, int(i * density))
+        links = [f"n{j}" for j in sorted(set(rnd.randrange(i) for _ in range(count)))]
+        component = "wait-sequencer-any" if rnd.random() < 0.05 else "run-job"
+        nodes.append(make_node(f"n{i}", component, links, [ref_input("in", [f"n{rnd.randrange(i)}"])]))
+    return nodes
+
+
+def gen_nested(size, rnd, density):
+    nodes = [make_node("n0", "run-job")]
+    for i in range(1, size):
+        count = max(1, int(i * density))
+        links = [f"n{j}" for j in sorted(set(rnd.randrange(i) for _ in range(count)))]
+        refs = [f"n{rnd.randrange(i)}" for _ in range(NESTED_REFS)]
+        inputs = [
+            ref_input("expr", refs[:-1]),
+            {"name": "output", "value_from": {"node_output": {"node_id_ref": refs[-1], "output_name": "result"}}}
+        ]
+        component = "wait-sequencer-any" if rnd.random() < 0.05 else "run-job"
+        nodes.append(make_node(f"n{i}", component, links, inputs))
+    return nodes
+
+
+GENERATORS = {
+    "chain": gen_chain,
+    "diamond": gen_diamond,
+    "fanin": gen_fanin,
+    "random": gen_random,
+    "nested": gen_nested
+}
+
+
+def generate_flow(shape, size, seed=0, density=0.002):
+    rnd = random.Random(seed)
+    pipeline_id = f"{shape}-{size}"
+    return {
+        "doc_type": "pipeline",
+        "version": "3.0",
+        "id": pipeline_id,
+        "primary_pipeline": pipeline_id,
+        "pipelines": [{"id": pipeline_id, "nodes": GENERATORS[shape](size, rnd, density)}]
+    }
+
+
+def measure(args, pipeline, repeat):
+    # Runtime is the best of the repeats; peak memory is taken from a separate
+    # traced run because tracemalloc slows the analysis down considerably
+    best = None
+    findings = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = find_nodes.analyze_pipeline_graph(args, pipeline)
+        elapsed = time.perf_counter() - start
+        findings = len(result["findings"])
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    find_nodes.analyze_pipeline_graph(args, pipeline)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, findings
+
+
+def run_benchmark(args):
+    fn_args = find_nodes.build_parser().parse_args([])
+    shapes = args.shapes.split(",")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    rows = []
+
+    print(f"{'shape':<8} {'nodes':>7} {'edges':>8} {'time ms':>10} {'peak MB':>9} {'findings':>9}")
+    for shape in shapes:
+        for size in sizes:
+            flow = generate_flow(shape, size, seed=args.seed, density=args.density)
+            if args.write_flows is not None:
+                os.makedirs(args.write_flows, exist_ok=True)
+                with open(os.path.join(args.write_flows, f"{shape}-{size}.json"), "w") as f:
+                    json.dump(flow, f)
+            pipeline = flow["pipelines"][0]
+            nodes = len(pipeline["nodes"])
+            edges = sum(len(node["inputs"][0].get("links", [])) for node in pipeline["nodes"])
+            elapsed, peak, findings = measure(fn_args, pipeline, args.repeat)
+            row = {
+                "shape": shape,
+                "nodes": nodes,
+                "edges": edges,
+                "density": args.density,
+                "time_ms": round(elapsed * 1000, 3),
+                "peak_mb": round(peak / (1024 * 1024), 3),
+                "findings": findings
+            }
+            rows.append(row)
+            print(f"{shape:<8} {nodes:>7} {edges:>8} {row['time_ms']:>10} {row['peak_mb']:>9} {findings:>9}")
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shapes", type=str, default=",".join(SHAPES),
+                        help=f"Comma separated graph shapes. Default: {','.join(SHAPES)}")
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES,
+                        help=f"Comma separated node counts. Default: {DEFAULT_SIZES}")
+    parser.add_argument("--density", type=float, default=0.002,
+                        help="Fraction of earlier nodes each node links to in random and nested shapes. Default: 0.002")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per flow. Default: 3")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed. Default: 0")
+    parser.add_argument("--output", type=str, help="Write results as CSV")
+    parser.add_argument("--write-flows", type=str, help="Also save the generated flows to this directory")
+
+    args = parser.parse_args()
+
+    unknown = [shape for shape in args.shapes.split(",") if shape not in GENERATORS]
+    if unknown:
+        print(f"Unknown shapes: {','.join(unknown)}. Available: {','.join(SHAPES)}")
+        exit(1)
+
+    run_benchmark(args)
@@ -11,13 +11,61 @@
 #
 # Example:
 #   python find_nodes.py --pipeline-file ./pipeline.json
+#
+# Large exports can be analyzed one pipeline at a time with --stream:
+#   python find_nodes.py --pipeline-file ./pipeline.json --stream
+#
+# A directory of exports (or a glob) is analyzed in parallel with one merged report:
+#   python find_nodes.py --pipeline-dir ./exports --workers 8
+#   python find_nodes.py --pipeline-glob "./exports/*/flow-*.json"
+#
+# Results of unchanged pipelines can be replayed from an on-disk cache:
+#   python find_nodes.py --pipeline-dir ./exports --cache-dir ./.find_nodes_cache
+#
+# Other checks run in the same pass over each pipeline:
+#   python find_nodes.py --pipeline-file ./pipeline.json --rules wait-any,cycle,dangling-ref,unused-output,unreachable
+#
+# Longest dependency chain, parallel width and nodes per level, optionally weighted by node durations:
+#   python find_nodes.py --pipeline-file ./pipeline.json --rules critical-path --cost-file ./costs.csv
+#
+# Links that are already implied by another path and can be removed:
+#   python find_nodes.py --pipeline-file ./pipeline.json --rules redundant-link
+#
+# Machine readable records, one per finding:
+#   python find_nodes.py --pipeline-dir ./exports --output-format ndjson > findings.ndjson
+#
+# Downstream impact of changing nodes (ids or names, inline or one per line in a file):
+#   python find_nodes.py --pipeline-file ./pipeline.json --impact <node-id>,<node-name>
+#   python find_nodes.py --pipeline-file ./pipeline.json --impact-file ./changed_nodes.txt
+#
+# Long-lived query mode, flows stay loaded between queries:
+#   python find_nodes.py --serve 8765
+#   curl "http://127.0.0.1:8765/reach?file=./pipeline.json&from=<node>&to=<node>"
+#   curl "http://127.0.0.1:8765/hazards?file=./pipeline.json&rules=wait-any,cycle"
+#   curl "http://127.0.0.1:8765/impact?file=./pipeline.json&node=<node>"
+#   python find_nodes.py --repl
+#
+# Sub-flows duplicated across a corpus of exports, matched by structure rather than ids:
+#   python find_nodes.py --pipeline-dir ./exports --fragments --min-fragment-size 3
+#   python find_nodes.py --pipeline-dir ./exports --fragments --fragment-depth 10
+#
+# Added, removed, re-linked nodes and changed inputs between two versions of a flow:
+#   python find_nodes.py --diff ./pipeline_v1.json ./pipeline_v2.json
+#
+# Hazards and reachability across supernode/sub-pipeline boundaries:
+#   python find_nodes.py --pipeline-file ./pipeline.json --unified
 
 import os
 import re
+import sys
+import csv
 import json
 import base64
 import shutil
 import pathlib
+import glob
+import hashlib
+import functools
 import argparse
 import subprocess
 import socketserver
@@ -27,123 +75,1869 @@ from requests.adapters import HTTPAdapter
 import urllib3
 from datetime import datetime
 import time
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+STREAM_CHUNK_SIZE = 1024 * 1024
+EXPR_CACHE_SIZE = 65536
+# Above this many nodes the parallel width is reported as a lower bound
+WIDTH_EXACT_LIMIT = 5000
+# Columns of the csv output format; the ndjson format carries every field
+FINDING_FIELDS = ["file", "pipeline_id", "rule", "node_id", "node_name", "input",
+                  "ref_id", "ref_name", "sequencer_ids", "message"]
+# Bump whenever the analysis or the result format changes so stale cache
+# entries are not replayed
+CACHE_VERSION = 9
+
 #############################
 
 
-def extract_task_id_from_expr(args, expression):
-    result = re.search(r"tasks\.([a-zA-Z0-9_]+)", expression)
-    if result is None:
-        return set()
-    return set(result.groups())
+# A single pass over the expression: string literals are matched first so
+# that references quoted inside them are skipped, then every
+# tasks/params/vars/param_sets reference in dotted or ["..."] form.
+EXPR_TOKEN_RE = re.compile(r"""
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?<![\w.])(?P<kind>tasks|params|vars|param_sets)
+    (?:\.(?P<name>\w+)|\[\s*["'](?P<qname>[^"']*)["']\s*\])
+    (?:\.(?P<attr1>\w+)|\[\s*["'](?P<qattr1>[^"']*)["']\s*\])?
+    (?:\.(?P<attr2>\w+)|\[\s*["'](?P<qattr2>[^"']*)["']\s*\])?
+""", re.VERBOSE)
+
 
+@functools.lru_cache(maxsize=EXPR_CACHE_SIZE)
+def scan_expression(expression):
+    """Every reference in an expression as (kind, name, detail) tuples, cached by expression text."""
+    refs = []
+    for match in EXPR_TOKEN_RE.finditer(expression):
+        kind = match.group("kind")
+        if kind is None:
+            continue
+        name = match.group("name") or match.group("qname")
+        attr1 = match.group("attr1") or match.group("qattr1")
+        attr2 = match.group("attr2") or match.group("qattr2")
+        detail = None
+        if kind == "tasks" and attr1 == "results":
+            detail = attr2
+        elif kind == "param_sets":
+            detail = attr1
+        refs.append((kind, name, detail))
+    return tuple(dict.fromkeys(refs))
 
-def extract_ref_tasks(args, input):
+
+def extract_refs(args, input):
     refs = set()
     vf = input.get("value_from")
     if vf is None:
         return refs
     if vf.get("expression") is not None:
-        refs = refs.union(extract_task_id_from_expr(args, vf["expression"]))
+        refs.update(scan_expression(vf["expression"]))
     if vf.get("node_output") is not None:
-        refs.add(vf["node_output"]["node_id_ref"])
+        refs.add(("tasks", vf["node_output"]["node_id_ref"], vf["node_output"].get("output_name")))
     return refs
 
 
 def extract_node(args, node):
-    links = ()
-    if "links" in node["inputs"][0]:
-        links = [link["node_id_ref"] for link in node["inputs"][0]["links"] if "links" in node["inputs"][0]]
+    app_data = node.get("app_data", {})
+    pipeline_data = app_data.get("pipeline_data", {})
+    # Links can arrive on any input port, not only the first one
+    links = [link["node_id_ref"] for port in node.get("inputs", []) for link in port.get("links", [])]
     node_def = {
         "id": node["id"],
-        "name": node["app_data"]["pipeline_data"]["descriptive_name"],
-        "type": node["app_data"]["pipeline_data"]["config"]["link"]["component_id_ref"],
+        "name": pipeline_data.get("descriptive_name") or app_data.get("ui_data", {}).get("label") or node["id"],
+        "type": pipeline_data.get("config", {}).get("link", {}).get("component_id_ref") or node.get("type"),
         "task_refs_per_input": {},
+        "refs_per_input": {},
+        "outputs": [out.get("name") for out in pipeline_data.get("outputs", [])],
         "links": links
     }
     refs = set()
-    inputs = node["app_data"]["pipeline_data"]["inputs"]
+    inputs = pipeline_data.get("inputs", [])
     for inp in inputs:
-        inp_refs = extract_ref_tasks(args, inp)
+        inp_all_refs = extract_refs(args, inp)
+        inp_refs = {name for kind, name, _ in inp_all_refs if kind == "tasks"}
+        node_def["refs_per_input"][inp["name"]] = inp_all_refs
         node_def["task_refs_per_input"][inp["name"]] = inp_refs
         refs = refs.union(inp_refs)
     node_def["task_refs"] = refs
     return node_def
 
 
-def follow_link(args, all_nodes, node, target, top_call=True):
-    any_sequencer_on_path = False
-    found = False
-    target_node = all_nodes[target]
-    for prev in node["links"]:
-        prev = all_nodes[prev]
-        if prev["id"] == target:
-            found = True
-            break
-        else:
-            if prev["type"] == "wait-sequencer-any":
-                any_sequencer_on_path = True
-            f, o = follow_link(args, all_nodes, prev, target, top_call=False)
-            if o:
-                any_sequencer_on_path = True
-            if f:
-                found = True
-                break
-    if top_call and found and any_sequencer_on_path:
-        ainput = ""
-        for inp_ref in node["task_refs_per_input"]:
-            if target in node["task_refs_per_input"][inp_ref]:
-                ainput = inp_ref
-        print(f"Node \"{node['name']}\" : {ainput} is using output from \"{target_node['name']}\" via wait for any")
-    return found, any_sequencer_on_path
+def build_ancestor_index(args, all_nodes):
+    """Interned ids, CSR adjacency and ancestor bitsets of a ``links`` graph.
+    Nodes with a ``scope`` only inherit the ancestors listed in it.
+    """
+    ids = list(all_nodes)
+    pos = {nid: i for i, nid in enumerate(ids)}
+    size = len(ids)
+
+    pred_start = array("i", [0])
+    preds = array("i")
+    wait_any = bytearray(size)
+    wait_any_mask = 0
+    boundary = bytearray(size)
+    scope_masks = {}
+    scoped = {}
+    for i, nid in enumerate(ids):
+        node = all_nodes[nid]
+        if node["type"] == "wait-sequencer-any":
+            wait_any[i] = 1
+            wait_any_mask |= 1 << i
+        if node.get("boundary"):
+            boundary[i] = 1
+        scope = node.get("scope")
+        if scope is not None:
+            if id(scope) not in scope_masks:
+                bits = bytearray((size + 7) // 8)
+                for member in scope:
+                    p = pos.get(member)
+                    if p is not None:
+                        bits[p >> 3] |= 1 << (p & 7)
+                scope_masks[id(scope)] = int.from_bytes(bits, "little")
+            scoped[i] = scope_masks[id(scope)]
+        for prev in node["links"]:
+            p = pos.get(prev)
+            if p is not None:
+                preds.append(p)
+        pred_start.append(len(preds))
+
+    succ_start = array("i", bytes(4 * (size + 1)))
+    for p in preds:
+        succ_start[p + 1] += 1
+    for i in range(size):
+        succ_start[i + 1] += succ_start[i]
+    succs = array("i", bytes(4 * len(preds)))
+    fill = array("i", succ_start[:size])
+    for i in range(size):
+        for k in range(pred_start[i], pred_start[i + 1]):
+            p = preds[k]
+            succs[fill[p]] = i
+            fill[p] += 1
+
+    # Iterative Tarjan over predecessor edges; components come out in topological order
+    visit = array("i", [-1]) * size
+    low = array("i", bytes(4 * size))
+    on_stack = bytearray(size)
+    stack = []
+    components = []
+    counter = 0
+    for root in range(size):
+        if visit[root] != -1:
+            continue
+        visit[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [[root, pred_start[root]]]
+        while work:
+            frame = work[-1]
+            v, k = frame
+            if k < pred_start[v + 1]:
+                frame[1] = k + 1
+                w = preds[k]
+                if visit[w] == -1:
+                    visit[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    work.append([w, pred_start[w]])
+                elif on_stack[w] and visit[w] < low[v]:
+                    low[v] = visit[w]
+                continue
+            work.pop()
+            if work and low[v] < low[work[-1][0]]:
+                low[work[-1][0]] = low[v]
+            if low[v] == visit[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = 0
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+
+    ancestors = [0] * size
+    any_ancestors = [0] * size
+    blocked = bytearray(size)
+    order = []
+    cycles = []
+    for component in components:
+        members = 0
+        for m in component:
+            members |= 1 << m
+        anc = 0
+        any_anc = 0
+        cyclic = len(component) > 1
+        has_wait_any = False
+        is_blocked = False
+        for m in component:
+            has_wait_any = has_wait_any or wait_any[m]
+            for k in range(pred_start[m], pred_start[m + 1]):
+                p = preds[k]
+                if (members >> p) & 1:
+                    cyclic = True
+                    continue
+                anc |= ancestors[p] | (1 << p)
+                any_anc |= ancestors[p] if wait_any[p] else any_ancestors[p]
+                is_blocked = is_blocked or blocked[p]
+        if cyclic:
+            # Every member reaches every other one around the cycle
+            anc |= members
+            if has_wait_any:
+                any_anc = anc
+            cycles.append(sorted(component))
+        elif component[0] in scoped:
+            anc &= scoped[component[0]]
+            any_anc &= scoped[component[0]]
+        for m in component:
+            ancestors[m] = anc
+            any_ancestors[m] = any_anc
+            blocked[m] = cyclic or is_blocked
+        if not blocked[component[0]]:
+            order.append(component[0])
+
+    return {
+        "ids": ids,
+        "pos": pos,
+        "pred_start": pred_start,
+        "preds": preds,
+        "succ_start": succ_start,
+        "succs": succs,
+        "wait_any": wait_any,
+        "wait_any_mask": wait_any_mask,
+        "boundary": boundary,
+        "scoped": bool(scoped),
+        "order": order,
+        "blocked": blocked,
+        "cycles": cycles,
+        "ancestors": ancestors,
+        "any_ancestors": any_ancestors
+    }
+
 
+def follow_link(args, index, node, target):
+    i = index["pos"].get(node["id"])
+    t = index["pos"].get(target)
+    if i is None or t is None:
+        return False, False
+    bit = 1 << t
+    return bool(index["ancestors"][i] & bit), bool(index["any_ancestors"][i] & bit)
 
-def process_node(args, node, all_nodes):
+
+def process_node(args, node, all_nodes, index):
+    findings = []
     task_refs = node["task_refs"]
     if len(task_refs) == 0:
+        return findings
+    for ref_id in sorted(task_refs):
+        found, any_sequencer_on_path = follow_link(args, index, node, ref_id)
+        if found and any_sequencer_on_path:
+            target_node = all_nodes[ref_id]
+            ainput = ""
+            for inp_ref in node["task_refs_per_input"]:
+                if ref_id in node["task_refs_per_input"][inp_ref]:
+                    ainput = inp_ref
+            findings.append({
+                "node_id": node["id"],
+                "node_name": node["name"],
+                "input": ainput,
+                "ref_id": ref_id,
+                "ref_name": target_node["name"],
+                "sequencer_ids": sequencers_on_path(args, index, node, ref_id)
+            })
+    return findings
+
+
+def sequencers_on_path(args, index, node, target):
+    # Wait-for-any nodes that sit between target and node: upstream of node
+    # and downstream of target
+    i = index["pos"][node["id"]]
+    t = index["pos"][target]
+    ancestors = index["ancestors"]
+    candidates = ancestors[i] & index["wait_any_mask"]
+    return [index["ids"][s] for s in iter_bits(candidates) if s != t and (ancestors[s] >> t) & 1]
+
+
+def check_wait_any(args, ctx, node):
+    return process_node(args, node, ctx["all_nodes"], ctx["index"])
+
+
+def check_dangling_refs(args, ctx, node):
+    findings = []
+    all_nodes = ctx["all_nodes"]
+    refs = [("links", prev) for prev in node["links"]]
+    for inp_ref in node["task_refs_per_input"]:
+        refs.extend((inp_ref, ref_id) for ref_id in sorted(node["task_refs_per_input"][inp_ref]))
+    for ainput, ref_id in refs:
+        if ref_id not in all_nodes:
+            findings.append({
+                "node_id": node["id"],
+                "node_name": node["name"],
+                "input": ainput,
+                "ref_id": ref_id
+            })
+    return findings
+
+
+def collect_used_outputs(args, ctx, node):
+    used = ctx["state"].setdefault("used_outputs", {})
+    for refs in node["refs_per_input"].values():
+        for kind, name, detail in refs:
+            if kind != "tasks":
+                continue
+            names = used.setdefault(name, set())
+            # A reference without an output name may read any of them
+            names.add(detail if detail is not None else "*")
+    return []
+
+
+def check_unused_outputs(args, ctx):
+    findings = []
+    used = ctx["state"].get("used_outputs", {})
+    for node in ctx["all_nodes"].values():
+        names = used.get(node["id"], set())
+        if "*" in names:
+            continue
+        for output in node["outputs"]:
+            if output not in names:
+                findings.append({
+                    "node_id": node["id"],
+                    "node_name": node["name"],
+                    "output": output
+                })
+    return findings
+
+
+def check_unreachable(args, ctx):
+    # Nodes on or downstream of a cycle wait on themselves and never start
+    index = ctx["index"]
+    findings = []
+    for i, nid in enumerate(index["ids"]):
+        if index["blocked"][i] and not index["boundary"][i]:
+            node = ctx["all_nodes"][nid]
+            findings.append({"node_id": nid, "node_name": node["name"]})
+    return findings
+
+
+def check_cycles(args, ctx):
+    index = ctx["index"]
+    all_nodes = ctx["all_nodes"]
+    findings = []
+    for cycle in index["cycles"]:
+        names = [all_nodes[index["ids"][i]]["name"] for i in cycle]
+        findings.append({
+            "node_id": index["ids"][cycle[0]],
+            "node_name": names[0],
+            "cycle": names
+        })
+    return findings
+
+
+def load_cost_file(args):
+    """Per-node costs from a JSON object or ``node,cost`` CSV, keyed by node id or name."""
+    if args.cost_file is None:
+        return {}
+    return _read_cost_file(args.cost_file)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_cost_file(path):
+    with open(path, 'r') as file:
+        if path.endswith(".json"):
+            return {str(k): float(v) for k, v in json.load(file).items()}
+        costs = {}
+        for row in csv.reader(file):
+            if len(row) >= 2 and not row[0].startswith("#"):
+                try:
+                    costs[row[0].strip()] = float(row[1])
+                except ValueError:
+                    # header or malformed row
+                    continue
+        return costs
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def antichain_width(index):
+    """Largest set of mutually independent nodes: node count minus a maximum matching over descendants."""
+    boundary = index["boundary"]
+    order = [i for i in index["order"] if not boundary[i]]
+    succ_start = index["succ_start"]
+    succs = index["succs"]
+    size = len(index["ids"])
+    descendants = [0] * size
+    if index["scoped"]:
+        # Links into a shared sub-pipeline body reach every caller, the scoped
+        # ancestor bitsets only the right one
+        for j in order:
+            for i in iter_bits(index["ancestors"][j]):
+                descendants[i] |= 1 << j
+    else:
+        for i in reversed(index["order"]):
+            desc = 0
+            for k in range(succ_start[i], succ_start[i + 1]):
+                s = succs[k]
+                desc |= descendants[s] | (1 << s)
+            descendants[i] = desc
+        real = 0
+        for i in order:
+            real |= 1 << i
+        descendants = [desc & real for desc in descendants]
+
+    match_right = {}
+    matched = 0
+    taken = 0
+    free_left = []
+    for u in order:
+        cand = descendants[u] & ~taken
+        if cand:
+            low = cand & -cand
+            taken |= low
+            match_right[low.bit_length() - 1] = u
+            matched += 1
+        else:
+            free_left.append(u)
+
+    for root in free_left:
+        visited = 0
+        stack = [[root, descendants[root], -1]]
+        while stack:
+            frame = stack[-1]
+            cand = frame[1] & ~visited
+            if not cand:
+                stack.pop()
+                continue
+            low = cand & -cand
+            visited |= low
+            frame[1] = cand ^ low
+            v = low.bit_length() - 1
+            frame[2] = v
+            if v not in match_right:
+                for u, _, chosen in stack:
+                    match_right[chosen] = u
+                matched += 1
+                break
+            stack.append([match_right[v], descendants[match_right[v]], -1])
+
+    return len(order) - matched
+
+
+def longest_paths(index, all_nodes, cost):
+    # Longest path ending at every node. "dist" restarts at the entries of a sub-pipeline
+    # and reaches the caller through the call's end node; "absolute" does not restart.
+    ids = index["ids"]
+    pos = index["pos"]
+    boundary = index["boundary"]
+    pred_start = index["pred_start"]
+    preds = index["preds"]
+    size = len(ids)
+    dist = [0.0] * size
+    absolute = [0.0] * size
+    via = [-1] * size
+    for i in index["order"]:
+        node = all_nodes[ids[i]]
+        best = 0.0
+        best_absolute = 0.0
+        for k in range(pred_start[i], pred_start[i + 1]):
+            p = preds[k]
+            best_absolute = max(best_absolute, absolute[p])
+            if boundary[p] and "call_start" not in all_nodes[ids[p]]:
+                continue
+            if via[i] == -1 or dist[p] > best:
+                best = dist[p]
+                via[i] = p
+        if "call_start" in node:
+            s = pos[node["call_start"]]
+            dist[i] = dist[s] + best
+            absolute[i] = absolute[s] + best
+        else:
+            dist[i] = best + cost(node)
+            absolute[i] = best_absolute + cost(node)
+    return dist, absolute, via
+
+
+def check_critical_path(args, ctx):
+    index = ctx["index"]
+    boundary = index["boundary"]
+    order = [i for i in index["order"] if not boundary[i]]
+    if not order:
+        return []
+    all_nodes = ctx["all_nodes"]
+    ids = index["ids"]
+    costs = load_cost_file(args)
+
+    def cost(node):
+        if node.get("boundary"):
+            return 0.0
+        return costs.get(node["id"], costs.get(node["name"], 1.0))
+
+    dist, _, via = longest_paths(index, all_nodes, cost)
+    _, depth, _ = longest_paths(index, all_nodes, lambda node: 0.0 if node.get("boundary") else 1.0)
+
+    end = max(order, key=lambda i: dist[i])
+    path = []
+    calls = []
+    i = end
+    while i != -1:
+        node = all_nodes[ids[i]]
+        if not boundary[i]:
+            path.append(node["name"])
+        if "call_start" in node:
+            calls.append(index["pos"][node["call_start"]])
+        i = via[i]
+        # Leaving a body through its entry continues before the call
+        if i == -1 and calls:
+            i = calls.pop()
+    path.reverse()
+
+    levels = [0] * int(max(depth[i] for i in order))
+    for i in order:
+        levels[int(depth[i]) - 1] += 1
+
+    if len(order) <= WIDTH_EXACT_LIMIT:
+        width = antichain_width(index)
+        exact = True
+    else:
+        # Any level is an antichain, so the widest one is a lower bound
+        width = max(levels)
+        exact = False
+
+    return [{
+        "node_id": ids[end],
+        "node_name": all_nodes[ids[end]]["name"],
+        "length": dist[end],
+        "path": path,
+        "width": width,
+        "width_exact": exact,
+        "levels": levels
+    }]
+
+
+def format_critical_path(f):
+    width = f"{f['width']}" if f["width_exact"] else f">= {f['width']}"
+    levels = ",".join(str(count) for count in f["levels"])
+    return (f"Critical path {f['length']:g} over {len(f['path'])} nodes: {' -> '.join(f['path'])} : "
+            f"parallel width {width} : nodes per level {levels}")
+
+
+def check_redundant_links(args, ctx, node):
+    """Links implied by another path: P -> N is redundant when P is an ancestor of another predecessor of N."""
+    index = ctx["index"]
+    i = index["pos"][node["id"]]
+    preds = index["preds"][index["pred_start"][i]:index["pred_start"][i + 1]]
+    if len(preds) < 2 or index["blocked"][i]:
+        return []
+    ancestors = index["ancestors"]
+    ids = index["ids"]
+    all_nodes = ctx["all_nodes"]
+    implied = 0
+    for q in preds:
+        implied |= ancestors[q]
+    findings = []
+    seen = set()
+    for p in preds:
+        via = None
+        if p in seen:
+            via = p
+        elif (implied >> p) & 1:
+            via = next(q for q in preds if (ancestors[q] >> p) & 1)
+        seen.add(p)
+        if via is not None:
+            findings.append({
+                "node_id": node["id"],
+                "node_name": node["name"],
+                "ref_id": ids[p],
+                "ref_name": all_nodes[ids[p]]["name"],
+                "via_id": ids[via],
+                "via_name": all_nodes[ids[via]]["name"]
+            })
+    return findings
+
+
+def format_redundant_link(f):
+    if f["via_id"] == f["ref_id"]:
+        return f"Link \"{f['ref_name']}\" -> \"{f['node_name']}\" is duplicated"
+    return f"Link \"{f['ref_name']}\" -> \"{f['node_name']}\" is redundant, implied by the path through \"{f['via_name']}\""
+
+
+# Analyzers run over the shared graph of a pipeline. "node" is called once per
+# node during the single traversal, "finish" once after it; both return lists
+# of findings. "format" renders a finding for the text report.
+RULES = {
+    "wait-any": {
+        "node": check_wait_any,
+        "format": lambda f: f"Node \"{f['node_name']}\" : {f['input']} is using output from \"{f['ref_name']}\" via wait for any"
+    },
+    "dangling-ref": {
+        "node": check_dangling_refs,
+        "format": lambda f: f"Node \"{f['node_name']}\" : {f['input']} refers to missing node \"{f['ref_id']}\""
+    },
+    "unused-output": {
+        "node": collect_used_outputs,
+        "finish": check_unused_outputs,
+        "format": lambda f: f"Node \"{f['node_name']}\" : output {f['output']} is never used"
+    },
+    "cycle": {
+        "finish": check_cycles,
+        "format": lambda f: "Cycle between nodes " + ", ".join(f"\"{name}\"" for name in f["cycle"])
+    },
+    "unreachable": {
+        "finish": check_unreachable,
+        "format": lambda f: f"Node \"{f['node_name']}\" is unreachable, it is on or downstream of a cycle"
+    },
+    "critical-path": {
+        "finish": check_critical_path,
+        "format": format_critical_path
+    },
+    "redundant-link": {
+        "node": check_redundant_links,
+        "format": format_redundant_link
+    }
+}
+DEFAULT_RULES = "wait-any,cycle"
+
+
+def parse_rules(value):
+    # Comma separated rule names, or "all", as accepted by --rules
+    if value.strip() == "all":
+        return list(RULES)
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def selected_rules(args):
+    return parse_rules(args.rules)
+
+
+def format_finding(finding):
+    return RULES[finding.get("rule", "wait-any")]["format"](finding)
+
+
+def finding_sort_key(finding):
+    return (
+        finding.get("file", ""),
+        str(finding.get("pipeline_id")),
+        finding.get("rule", ""),
+        finding.get("node_name", ""),
+        finding.get("input", ""),
+        finding.get("ref_name") or finding.get("ref_id") or finding.get("output") or ""
+    )
+
+
+def pipeline_cache_key(args, pipeline):
+    """Hash of the parts of a pipeline the analysis depends on, canvas positions excluded."""
+    nodes = []
+    for node in pipeline.get("nodes", []):
+        app_data = node.get("app_data", {})
+        pipeline_data = app_data.get("pipeline_data", {})
+        nodes.append([
+            node.get("id"),
+            node.get("type"),
+            node.get("subflow_ref", {}).get("pipeline_id_ref"),
+            pipeline_data.get("descriptive_name"),
+            app_data.get("ui_data", {}).get("label"),
+            pipeline_data.get("config", {}).get("link", {}).get("component_id_ref"),
+            [port.get("links", []) for port in node.get("inputs", [])],
+            pipeline_data.get("inputs", []),
+            pipeline_data.get("outputs", [])
+        ])
+    options = [selected_rules(args), sorted(load_cost_file(args).items())]
+    payload = json.dumps([CACHE_VERSION, options, pipeline.get("id"), nodes], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_path(args, key):
+    return os.path.join(args.cache_dir, key[:2], f"{key}.json")
+
+
+def load_cached_result(args, key):
+    path = cache_path(args, key)
+    try:
+        with open(path, 'r') as file:
+            result = json.load(file)
+        # Touch the entry so eviction drops the least recently used ones first
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    result["cached"] = True
+    return result
+
+
+def store_cached_result(args, key, result):
+    path = cache_path(args, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(result, file)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log(args, f"could not write cache entry {path}: {e}")
+
+
+def evict_result_cache(args):
+    if args.cache_dir is None or not os.path.isdir(args.cache_dir):
         return
-    for ref_id in task_refs:
-        follow_link(args, all_nodes, node, ref_id)
+    entries = []
+    total = 0
+    for path in glob.glob(os.path.join(args.cache_dir, "*", "*.json")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    limit = args.cache_max_mb * 1024 * 1024
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
 
+def analyze_pipeline(args, pipeline):
+    if args.cache_dir is not None:
+        key = pipeline_cache_key(args, pipeline)
+        result = load_cached_result(args, key)
+        if result is not None:
+            return result
+        result = analyze_pipeline_graph(args, pipeline)
+        store_cached_result(args, key, result)
+        return result
+    return analyze_pipeline_graph(args, pipeline)
 
-def process_pipeline(args, pipeline):
+
+def extract_nodes(args, pipeline):
     all_nodes = {}
-    pid = pipeline.get("id")
-    nodes = pipeline.get("nodes")
-    print(f"pipeline {pid} : nodes {len(nodes)}")
-    for node in nodes:
+    for node in pipeline.get("nodes"):
         ndef = extract_node(args, node)
         all_nodes[ndef["id"]] = ndef
+    return all_nodes
+
+
+def boundary_node(nid, name, links, **extra):
+    node = {"id": nid, "name": name, "type": "super_node_boundary", "boundary": True,
+            "task_refs_per_input": {}, "refs_per_input": {}, "task_refs": set(), "outputs": [], "links": links}
+    node.update(extra)
+    return node
+
+
+def extract_unified_nodes(args, pipelines):
+    """One graph over every pipeline of a flow, keyed by "<pipeline id>/<node id>"."""
+    per_pipeline = OrderedDict((pipeline.get("id"), extract_nodes(args, pipeline)) for pipeline in pipelines)
+    callers = {}
+    for pipeline in pipelines:
+        pid = pipeline.get("id")
+        for node in pipeline.get("nodes", []):
+            if node.get("type") != "super_node":
+                continue
+            sub = node.get("subflow_ref", {}).get("pipeline_id_ref")
+            if sub in per_pipeline and sub != pid:
+                callers.setdefault(sub, []).append((pid, node["id"]))
+
+    def resolve(pid, nid):
+        seen = {pid}
+        queue = deque([pid])
+        while queue:
+            current = queue.popleft()
+            if nid in per_pipeline[current]:
+                return f"{current}/{nid}"
+            for parent, _ in callers.get(current, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    queue.append(parent)
+        return f"{pid}/{nid}"
+
+    all_nodes = {}
+    for pid, nodes in per_pipeline.items():
+        for nid, ndef in nodes.items():
+            unified = dict(ndef)
+            unified["id"] = f"{pid}/{nid}"
+            unified["links"] = [f"{pid}/{prev}" for prev in ndef["links"]]
+            unified["task_refs_per_input"] = {
+                inp: {resolve(pid, ref) for ref in refs} for inp, refs in ndef["task_refs_per_input"].items()
+            }
+            unified["refs_per_input"] = {
+                inp: {(kind, resolve(pid, name) if kind == "tasks" else name, detail) for kind, name, detail in refs}
+                for inp, refs in ndef["refs_per_input"].items()
+            }
+            unified["task_refs"] = set().union(*unified["task_refs_per_input"].values())
+            all_nodes[unified["id"]] = unified
+
+    # Per call, the body's entries link to a start node linked to the supernode's predecessors, and the
+    # supernode links to an end node linked to the body's exits. Its scope keeps callers apart.
+    bodies = {}
+    starts = []
+    for sub, calls in callers.items():
+        nodes = per_pipeline[sub]
+        entries = [nid for nid, node in nodes.items() if not any(prev in nodes for prev in node["links"])]
+        linked = {prev for node in nodes.values() for prev in node["links"]}
+        exits = [nid for nid in nodes if nid not in linked]
+        # Nodes caught in a cycle reach no exit but still hold up the call
+        reached = set(exits)
+        queue = deque(exits)
+        while queue:
+            for prev in nodes[queue.popleft()]["links"]:
+                if prev in nodes and prev not in reached:
+                    reached.add(prev)
+                    queue.append(prev)
+        exits = [f"{sub}/{nid}" for nid in exits] + [f"{sub}/{nid}" for nid in nodes if nid not in reached]
+        for pid, nid in calls:
+            call = f"{pid}/{nid}/{sub}"
+            name = all_nodes[f"{pid}/{nid}"]["name"]
+            for entry in entries:
+                all_nodes[f"{sub}/{entry}"]["links"].append(f"{call}/start")
+            starts.append((f"{call}/start", f"{pid}/{nid}"))
+            all_nodes[f"{call}/start"] = boundary_node(f"{call}/start", f"{name} (start)", [], call_pipeline=sub)
+            all_nodes[f"{call}/end"] = boundary_node(f"{call}/end", f"{name} (end)", exits,
+                                                     call_pipeline=sub, call_start=f"{call}/start")
+            bodies.setdefault(pid, []).append((sub, call, f"{pid}/{nid}"))
+
+    for start, supernode in starts:
+        all_nodes[start]["links"] = list(all_nodes[supernode]["links"])
+    for calls in bodies.values():
+        for _, call, supernode in calls:
+            all_nodes[supernode]["links"].append(f"{call}/end")
+
+    # Node ids of a sub-pipeline and of everything it calls, shared by its end nodes
+    scopes = {}
+    for sub in callers:
+        members = set()
+        seen = {sub}
+        queue = deque([sub])
+        while queue:
+            current = queue.popleft()
+            members.update(f"{current}/{nid}" for nid in per_pipeline[current])
+            for inner_sub, call, _ in bodies.get(current, ()):
+                members.update((f"{call}/start", f"{call}/end"))
+                if inner_sub not in seen:
+                    seen.add(inner_sub)
+                    queue.append(inner_sub)
+        scopes[sub] = frozenset(members)
+    for node in all_nodes.values():
+        if "call_start" in node:
+            node["scope"] = scopes[node["call_pipeline"]]
+    return all_nodes
+
+
+def iter_node_sets(args, path):
+    # (pipeline id, extracted nodes) per pipeline, or once for the whole flow
+    # with --unified, labelled with the id of its primary pipeline
+    if args.unified:
+        primary, pipelines = load_flow(args, path)
+        if pipelines:
+            yield primary, extract_unified_nodes(args, pipelines)
+        return
+    for pipeline in iter_pipelines(args, path):
+        yield pipeline.get("id"), extract_nodes(args, pipeline)
+
+
+def analyze_flow_unified(args, primary, pipelines):
+    key = None
+    if args.cache_dir is not None:
+        payload = json.dumps(["unified", primary] + [pipeline_cache_key(args, pipeline) for pipeline in pipelines])
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        result = load_cached_result(args, key)
+        if result is not None:
+            return result
+    all_nodes = extract_unified_nodes(args, pipelines)
+    index = build_ancestor_index(args, all_nodes)
+    findings = run_rules(args, primary, all_nodes, index, selected_rules(args))
+    nodes = sum(1 for node in all_nodes.values() if not node.get("boundary"))
+    result = {"pipeline_id": primary, "nodes": nodes, "findings": findings}
+    if key is not None:
+        store_cached_result(args, key, result)
+    return result
+
+
+def load_pipeline_graph(args, pipeline):
+    all_nodes = extract_nodes(args, pipeline)
+    return all_nodes, build_ancestor_index(args, all_nodes)
+
+
+def analyze_pipeline_graph(args, pipeline):
+    pid = pipeline.get("id")
+    nodes = pipeline.get("nodes")
+    all_nodes, index = load_pipeline_graph(args, pipeline)
+    findings = run_rules(args, pid, all_nodes, index, selected_rules(args))
+    return {"pipeline_id": pid, "nodes": len(nodes), "findings": findings}
+
+
+def run_rules(args, pid, all_nodes, index, rule_names):
+    ctx = {"pipeline_id": pid, "all_nodes": all_nodes, "index": index, "state": {}}
+    rules = [(name, RULES[name]) for name in rule_names]
+    node_rules = [(name, rule["node"]) for name, rule in rules if "node" in rule]
+    findings = []
     for nid in all_nodes:
         node = all_nodes[nid]
-        process_node(args, node, all_nodes)
+        if node.get("boundary"):
+            continue
+        for name, check in node_rules:
+            for finding in check(args, ctx, node):
+                finding["rule"] = name
+                findings.append(finding)
+    for name, rule in rules:
+        if "finish" in rule:
+            for finding in rule["finish"](args, ctx):
+                finding["rule"] = name
+                findings.append(finding)
+    for finding in findings:
+        finding["pipeline_id"] = pid
+    return findings
 
 
-def process_pipeline_file(args):
-    with open(args.pipeline_file, 'r') as file:
+class JsonStreamReader:
+    """Decodes one JSON value at a time from a buffer refilled on demand."""
+
+    def __init__(self, file, chunk_size=STREAM_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        if self.eof:
+            return False
+        chunk = self.file.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected '{char}' at offset {self.pos} of the current chunk")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number can be cut in half at the end of a chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the read size so that refilling a large value stays linear
+            size = max(size, len(self.buffer) - self.pos)
+            self._fill(size)
+
+
+def iter_pipelines_stream(args, path, meta=None):
+    # meta, when given, receives the flow's primary_pipeline id and
+    # "pipelines": True once the pipelines array is found, even an empty one
+    with open(path, 'r') as file:
+        reader = JsonStreamReader(file)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == "pipelines" and reader.peek() == "[":
+                reader.expect("[")
+                if meta is not None:
+                    meta["pipelines"] = True
+                if reader.peek() == "]":
+                    reader.expect("]")
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.peek() == ",":
+                            reader.expect(",")
+                            continue
+                        reader.expect("]")
+                        break
+            else:
+                value = reader.value()
+                if meta is not None and key == "primary_pipeline":
+                    meta[key] = value
+            if reader.peek() == ",":
+                reader.expect(",")
+                continue
+            reader.expect("}")
+            return
+
+
+def iter_pipelines(args, path, meta=None):
+    # meta, when given, receives the flow's primary_pipeline id
+    if args.stream:
+        stream_meta = {}
+        yield from iter_pipelines_stream(args, path, stream_meta)
+        if meta is not None and "primary_pipeline" in stream_meta:
+            meta["primary_pipeline"] = stream_meta["primary_pipeline"]
+        if not stream_meta.get("pipelines"):
+            raise ValueError("file does not contain any pipelines")
+        return
+
+    with open(path, 'r') as file:
         data = json.load(file)
 
     pipelines = data.get("pipelines")
     if pipelines is None:
-        print("file does not contain any pipelines")
+        raise ValueError("file does not contain any pipelines")
+    if meta is not None and "primary_pipeline" in data:
+        meta["primary_pipeline"] = data["primary_pipeline"]
+
+    yield from pipelines
+
+
+def load_flow(args, path):
+    """Every pipeline of a flow and the id of its primary pipeline, None when there are none."""
+    meta = {}
+    pipelines = list(iter_pipelines(args, path, meta))
+    primary = meta.get("primary_pipeline")
+    if primary not in {pipeline.get("id") for pipeline in pipelines}:
+        primary = pipelines[0].get("id") if pipelines else None
+    return primary, pipelines
+
+
+def iter_pipeline_results(args, path):
+    if args.unified:
+        primary, pipelines = load_flow(args, path)
+        if pipelines:
+            yield analyze_flow_unified(args, primary, pipelines)
+        return
+    for pipeline in iter_pipelines(args, path):
+        yield analyze_pipeline(args, pipeline)
+
+
+def build_impact_index(args, all_nodes):
+    """Ancestor index of the reversed links and value_from references, i.e. what each node affects."""
+    dependents = {nid: [] for nid in all_nodes}
+    for nid, node in all_nodes.items():
+        for prev in set(node["links"]) | node["task_refs"]:
+            if prev in dependents and prev != nid:
+                dependents[prev].append(nid)
+    reverse = {
+        nid: {"id": nid, "type": node["type"], "links": dependents[nid]}
+        for nid, node in all_nodes.items()
+    }
+    return build_ancestor_index(args, reverse)
+
+
+def query_impact(args, all_nodes, impact_index, node_id):
+    i = impact_index["pos"][node_id]
+    ids = impact_index["ids"]
+    affected = []
+    for d in iter_bits(impact_index["ancestors"][i]):
+        node = all_nodes[ids[d]]
+        if node["id"] == node_id or node.get("boundary"):
+            continue
+        affected.append({
+            "id": node["id"],
+            "name": node["name"],
+            "consumes_output": node_id in node["task_refs"]
+        })
+    return affected
+
+
+def index_node_names(all_nodes):
+    by_name = {}
+    for node in all_nodes.values():
+        by_name.setdefault(node["name"], node["id"])
+    return by_name
+
+
+def read_impact_queries(args):
+    queries = []
+    if args.impact is not None:
+        queries.extend(q.strip() for q in args.impact.split(","))
+    if args.impact_file is not None:
+        with open(args.impact_file, 'r') as file:
+            queries.extend(line.strip() for line in file)
+    return [q for q in queries if q]
+
+
+def process_impact(args):
+    """Answer "what is affected by node X" for a batch of node ids or names."""
+    queries = read_impact_queries(args)
+    found = set()
+    out = None
+    if args.output_format == "csv":
+        out = csv.writer(sys.stdout)
+        out.writerow(["pipeline_id", "node_id", "node_name", "affected_id", "affected_name", "consumes_output"])
+    try:
+        for pid, all_nodes in iter_node_sets(args, args.pipeline_file):
+            by_name = index_node_names(all_nodes)
+            impact_index = build_impact_index(args, all_nodes)
+            for query in queries:
+                node_id = query if query in all_nodes else by_name.get(query)
+                if node_id is None:
+                    continue
+                found.add(query)
+                node = all_nodes[node_id]
+                affected = query_impact(args, all_nodes, impact_index, node_id)
+                if args.output_format == "ndjson":
+                    print(json.dumps({"pipeline_id": pid, "node_id": node_id, "node_name": node["name"],
+                                      "affected": affected}), flush=True)
+                elif args.output_format == "csv":
+                    for a in affected:
+                        out.writerow([pid, node_id, node["name"], a["id"], a["name"], a["consumes_output"]])
+                    sys.stdout.flush()
+                else:
+                    print(f"pipeline {pid} : Node \"{node['name']}\" affects {len(affected)} nodes")
+                    for a in affected:
+                        via = " (uses its output)" if a["consumes_output"] else ""
+                        print(f"    \"{a['name']}\"{via}")
+    except ValueError as e:
+        log(args, e)
         exit(1)
+    for query in queries:
+        if query not in found:
+            log(args, f"node {query} not found")
 
-    for pipeline in pipelines:
-        process_pipeline(args, pipeline)
 
+class FindingWriter:
+    """Writes findings as NDJSON or CSV records, flushing each one."""
 
-if __name__ == '__main__':
+    def __init__(self, output_format, out=sys.stdout):
+        self.output_format = output_format
+        self.out = out
+        self.csv = None
+        if output_format == "csv":
+            self.csv = csv.DictWriter(out, fieldnames=FINDING_FIELDS, extrasaction="ignore")
+            self.csv.writeheader()
+            out.flush()
+
+    def write(self, finding):
+        record = dict(finding)
+        record["message"] = format_finding(finding)
+        if self.csv is not None:
+            record["sequencer_ids"] = ";".join(record.get("sequencer_ids", []))
+            self.csv.writerow(record)
+        else:
+            self.out.write(json.dumps(record, default=str) + "\n")
+        self.out.flush()
+
+
+def log(args, message):
+    # Keep stdout for the records in the structured output formats
+    if args.output_format == "text":
+        print(message)
+    else:
+        print(message, file=sys.stderr)
+
+
+def process_pipeline_file(args):
+    writer = None
+    if args.output_format != "text":
+        writer = FindingWriter(args.output_format)
+    try:
+        for result in iter_pipeline_results(args, args.pipeline_file):
+            log(args, f"pipeline {result['pipeline_id']} : nodes {result['nodes']}")
+            for finding in result["findings"]:
+                if writer is not None:
+                    finding["file"] = args.pipeline_file
+                    writer.write(finding)
+                else:
+                    print(format_finding(finding))
+    except ValueError as e:
+        log(args, e)
+        exit(1)
+    finally:
+        evict_result_cache(args)
+
+
+def find_pipeline_files(args):
+    if args.pipeline_dir is not None:
+        pattern = os.path.join(args.pipeline_dir, "**", args.pipeline_glob or "*.json")
+    else:
+        pattern = args.pipeline_glob
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def analyze_pipeline_file(args, path):
+    # Runs in a worker process; errors are returned so one broken export
+    # does not abort the whole batch
+    try:
+        return path, list(iter_pipeline_results(args, path)), None
+    except Exception as e:
+        return path, [], str(e)
+
+
+def process_pipeline_dir(args):
+    paths = find_pipeline_files(args)
+    if len(paths) == 0:
+        log(args, "no pipeline files found")
+        exit(1)
+
+    workers = args.workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    log(args, f"analyzing {len(paths)} files with {workers} workers")
+
+    writer = None
+    if args.output_format != "text":
+        writer = FindingWriter(args.output_format)
+
+    findings = []
+    count = 0
+    errors = []
+    pipelines = 0
+    cached = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if writer is not None:
+            # Hand out records in completion order instead of waiting for the
+            # whole batch to be sorted
+            futures = [executor.submit(analyze_pipeline_file, args, path) for path in paths]
+            tasks = (future.result() for future in as_completed(futures))
+        else:
+            tasks = executor.map(analyze_pipeline_file, [args] * len(paths), paths, chunksize=chunksize)
+        for path, results, error in tasks:
+            if error is not None:
+                errors.append((path, error))
+            for result in results:
+                pipelines += 1
+                if result.get("cached"):
+                    cached += 1
+                for finding in result["findings"]:
+                    finding["file"] = path
+                    count += 1
+                    if writer is not None:
+                        writer.write(finding)
+                    else:
+                        findings.append(finding)
+
+    findings.sort(key=finding_sort_key)
+    for finding in findings:
+        print(f"{finding['file']} : pipeline {finding['pipeline_id']} : {format_finding(finding)}")
+    for path, error in errors:
+        log(args, f"{path} : failed : {error}")
+    log(args, f"files {len(paths)} : pipelines {pipelines} : cached {cached} : findings {count} : errors {len(errors)}")
+    evict_result_cache(args)
+
+
+def rewrite_task_refs(expression, replace):
+    """Replace the node id of every task reference in an expression by ``replace(node id)``."""
+    parts = []
+    last = 0
+    for match in EXPR_TOKEN_RE.finditer(expression):
+        if match.group("kind") != "tasks":
+            continue
+        group = "name" if match.group("name") is not None else "qname"
+        start, end = match.span(group)
+        parts.append(expression[last:start])
+        parts.append(replace(match.group(group)))
+        last = end
+    parts.append(expression[last:])
+    return "".join(parts)
+
+
+def node_signature(args, node, ref):
+    """Content of a node without ids, names and positions, references replaced by ``ref(node id)``."""
+    pipeline_data = node.get("app_data", {}).get("pipeline_data", {})
+
+    inputs = []
+    for inp in pipeline_data.get("inputs", []):
+        vf = inp.get("value_from")
+        if vf is None:
+            inputs.append([inp.get("name"), "value", inp.get("value")])
+        elif vf.get("expression") is not None:
+            expression = rewrite_task_refs(vf["expression"], ref)
+            inputs.append([inp.get("name"), "expression", expression])
+        elif vf.get("node_output") is not None:
+            output = vf["node_output"]
+            inputs.append([inp.get("name"), "node_output", ref(output.get("node_id_ref")), output.get("output_name")])
+        else:
+            inputs.append([inp.get("name"), "value_from", vf])
+    inputs.sort(key=lambda i: json.dumps(i, sort_keys=True, default=str))
+    return [pipeline_data.get("config", {}).get("link", {}).get("component_id_ref"), inputs]
+
+
+def digest(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def node_signatures(args, pipeline):
+    """Signature hash of every node, references replaced by the blanked signature of their target."""
+    raw_nodes = {node["id"]: node for node in pipeline.get("nodes")}
+    base = {nid: digest(node_signature(args, node, lambda ref: "ref")) for nid, node in raw_nodes.items()}
+    return {nid: digest(node_signature(args, node, lambda ref: base.get(ref, "?"))) for nid, node in raw_nodes.items()}
+
+
+def extent_digest(mask):
+    # Short stand-in for a node bitset, so extents can be compared without shipping the bitset
+    return hashlib.sha1(mask.to_bytes((mask.bit_length() + 7) // 8, "little")).hexdigest()[:16]
+
+
+def closure_hashes(args, index, signatures, direction):
+    """Merkle hash of every node and everything upstream (or downstream) of it, keyed by position."""
+    if direction == "upstream":
+        order, start, adjacent = index["order"], index["pred_start"], index["preds"]
+    else:
+        order, start, adjacent = reversed(index["order"]), index["succ_start"], index["succs"]
+    ids = index["ids"]
+    hashes = {}
+    for i in order:
+        below = [adjacent[k] for k in range(start[i], start[i + 1])]
+        if any(j not in hashes for j in below):
+            continue
+        hashes[i] = digest([direction, signatures[ids[i]], sorted(hashes[j] for j in below)])
+    return hashes
+
+
+def structural_hashes(args, pipeline, index):
+    """Merkle hashes of the sub-DAG within k links of every node, k up to --fragment-depth, then of its closure.
+    Returns ``{direction: {node id: [(depth, hash, size, extent digest), ...]}}``.
+    """
+    signatures = node_signatures(args, pipeline)
+    ids = index["ids"]
+    max_depth = max(0, args.fragment_depth)
+    result = {}
+    for direction in ("upstream", "downstream"):
+        closure = closure_hashes(args, index, signatures, direction)
+        if direction == "upstream":
+            start, adjacent = index["pred_start"], index["preds"]
+            closure_masks = {i: index["ancestors"][i] for i in closure}
+        else:
+            start, adjacent = index["succ_start"], index["succs"]
+            closure_masks = {}
+            for i in closure:
+                mask = 0
+                for k in range(start[i], start[i + 1]):
+                    mask |= closure_masks[adjacent[k]] | (1 << adjacent[k])
+                closure_masks[i] = mask
+
+        levels = {}
+        hashes = {}
+        masks = {}
+        for i in closure:
+            hashes[i] = digest([direction, signatures[ids[i]], []])
+            masks[i] = 1 << i
+            levels[i] = [(0, hashes[i], 1, extent_digest(masks[i]))]
+        for depth in range(1, max_depth + 1):
+            next_hashes = {}
+            next_masks = {}
+            for i in closure:
+                below = [adjacent[k] for k in range(start[i], start[i + 1])]
+                next_hashes[i] = digest([direction, signatures[ids[i]], sorted(hashes[j] for j in below)])
+                mask = 1 << i
+                for j in below:
+                    mask |= masks[j]
+                next_masks[i] = mask
+                if mask != masks[i]:
+                    levels[i].append((depth, next_hashes[i], mask.bit_count(), extent_digest(mask)))
+            hashes, masks = next_hashes, next_masks
+        for i, node_hash in closure.items():
+            mask = closure_masks[i] | (1 << i)
+            if mask != masks[i]:
+                levels[i].append((max_depth + 1, node_hash, mask.bit_count(), extent_digest(mask)))
+        result[direction] = {ids[i]: levels[i] for i in closure}
+    return result
+
+
+def fragment_pipeline_file(args, path):
+    # Runs in a worker process: hash the sub-DAGs of every pipeline in the file and
+    # return only hashes, sizes and extent digests
+    try:
+        fragments = []
+        for pipeline in iter_pipelines(args, path):
+            all_nodes, index = load_pipeline_graph(args, pipeline)
+            for direction, levels in structural_hashes(args, pipeline, index).items():
+                # Outward neighbours: a sub-DAG of a node one depth higher at
+                # these nodes contains the sub-DAG at this node
+                start, outward = ((index["succ_start"], index["succs"]) if direction == "upstream"
+                                  else (index["pred_start"], index["preds"]))
+
+                def covering(nid, depth):
+                    return next((h for d, h, _, _ in levels.get(nid, ()) if d >= depth), None)
+
+                for nid, node_levels in levels.items():
+                    i = index["pos"][nid]
+                    for n, (depth, node_hash, size, extent) in enumerate(node_levels):
+                        if size < args.min_fragment_size:
+                            continue
+                        enclosing = {covering(index["ids"][outward[k]], depth + 1)
+                                     for k in range(start[i], start[i + 1])}
+                        if n + 1 < len(node_levels):
+                            enclosing.add(node_levels[n + 1][1])
+                        enclosing.discard(None)
+                        enclosing.discard(node_hash)
+                        fragments.append([node_hash, direction, size, pipeline.get("id"), nid,
+                                          all_nodes[nid]["name"], sorted(enclosing), extent])
+        return path, fragments, None
+    except Exception as e:
+        return path, [], str(e)
+
+
+def group_fragments(occurrences):
+    """Duplicated fragments by hash, without those only found inside a larger duplicated fragment."""
+    groups = {}
+    for occurrence in occurrences:
+        groups.setdefault(occurrence["hash"], []).append(occurrence)
+    duplicated = {}
+    for node_hash, group in groups.items():
+        if len(group) < 2:
+            continue
+        common = set(group[0]["enclosing"])
+        for occurrence in group[1:]:
+            common &= set(occurrence["enclosing"])
+        if any(len(groups.get(d, ())) == len(group) for d in common):
+            continue
+        duplicated[node_hash] = group
+
+    def extents(group):
+        return {(o["file"], o["pipeline_id"], o["extent"]) for o in group}
+
+    covered = set()
+    for group in duplicated.values():
+        if group[0]["direction"] == "upstream":
+            covered.add(frozenset(extents(group)))
+    duplicated = {h: g for h, g in duplicated.items()
+                  if g[0]["direction"] == "upstream" or frozenset(extents(g)) not in covered}
+    return sorted(duplicated.items(), key=lambda g: (-g[1][0]["size"] * len(g[1]), g[0]))
+
+
+def process_fragments(args):
+    if args.pipeline_file is not None:
+        paths = [args.pipeline_file]
+    else:
+        paths = find_pipeline_files(args)
+    if len(paths) == 0:
+        log(args, "no pipeline files found")
+        exit(1)
+
+    workers = args.workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    log(args, f"hashing {len(paths)} files with {workers} workers")
+
+    occurrences = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = executor.map(fragment_pipeline_file, [args] * len(paths), paths, chunksize=chunksize)
+        for path, fragments, error in tasks:
+            if error is not None:
+                errors.append((path, error))
+            for node_hash, direction, size, pid, nid, name, enclosing, extent in fragments:
+                occurrences.append({"hash": node_hash, "direction": direction, "size": size, "file": path,
+                                    "pipeline_id": pid, "node_id": nid, "node_name": name,
+                                    "enclosing": enclosing, "extent": extent})
+
+    groups = group_fragments(occurrences)
+    out = csv.writer(sys.stdout) if args.output_format == "csv" else None
+    if out is not None:
+        out.writerow(["hash", "size", "copies", "file", "pipeline_id", "node_id", "node_name", "direction"])
+    for node_hash, group in groups:
+        direction = group[0]["direction"]
+        if args.output_format == "ndjson":
+            print(json.dumps({"hash": node_hash, "direction": direction, "size": group[0]["size"],
+                              "copies": len(group),
+                              "occurrences": [{k: o[k] for k in ("file", "pipeline_id", "node_id", "node_name")}
+                                              for o in group]}))
+        elif out is not None:
+            for o in group:
+                out.writerow([node_hash, o["size"], len(group), o["file"], o["pipeline_id"], o["node_id"],
+                              o["node_name"], direction])
+        else:
+            print(f"fragment {node_hash[:12]} : {group[0]['size']} nodes : {len(group)} copies")
+            anchor = "ends at" if direction == "upstream" else "starts at"
+            for o in group:
+                print(f"    {o['file']} : pipeline {o['pipeline_id']} : {anchor} \"{o['node_name']}\"")
+    for path, error in errors:
+        log(args, f"{path} : failed : {error}")
+    log(args, f"files {len(paths)} : duplicated fragments {len(groups)} : errors {len(errors)}")
+
+
+def diff_inputs(args, old_node, new_node, old_refs, new_refs):
+    # References are compared through the node matching: old_refs maps old ids to
+    # new ones, new_refs maps matched new ids to themselves
+    def inputs(node, refs):
+        result = {}
+        signature = {entry[0]: entry for entry in node_signature(args, node, lambda ref: refs.get(ref, "?"))[1]}
+        for inp in node.get("app_data", {}).get("pipeline_data", {}).get("inputs", []):
+            rest = {k: v for k, v in inp.items() if k not in ("ui_data", "value", "value_from")}
+            result[inp.get("name")] = json.dumps([rest, signature.get(inp.get("name"))], sort_keys=True, default=str)
+        return result
+    old_inputs = inputs(old_node, old_refs)
+    new_inputs = inputs(new_node, new_refs)
+    return sorted(str(name) for name in set(old_inputs) | set(new_inputs)
+                  if old_inputs.get(name) != new_inputs.get(name))
+
+
+def diff_link_names(ids, new, old):
+    # Links point at new ids when the node was matched, old ids when it was removed
+    names = []
+    for nid in ids:
+        side = new if nid in new["all_nodes"] else old
+        names.append(side["all_nodes"][nid]["name"] if nid in side["all_nodes"] else nid)
+    return sorted(names)
+
+
+def diff_pipeline(args, old_pipeline, new_pipeline):
+    """Changes between two versions of a pipeline, nodes paired by id, upstream structure, then content."""
+    sides = []
+    for pipeline in (old_pipeline, new_pipeline):
+        all_nodes, index = load_pipeline_graph(args, pipeline)
+        raw_nodes = {node["id"]: node for node in pipeline.get("nodes")}
+        signatures = node_signatures(args, pipeline)
+        tree = {index["ids"][i]: h for i, h in closure_hashes(args, index, signatures, "upstream").items()}
+        # Without its upstream, a node is only identified by its name and content
+        local = {nid: json.dumps([all_nodes[nid]["name"], node_signature(args, raw_nodes[nid], lambda ref: "?")],
+                                 sort_keys=True, default=str)
+                 for nid in all_nodes}
+        sides.append({"all_nodes": all_nodes, "raw": raw_nodes, "tree": tree, "local": local})
+    old, new = sides
+
+    matches = {nid: nid for nid in old["all_nodes"] if nid in new["all_nodes"]}
+    changes = []
+    for key in ("tree", "local"):
+        unmatched_new = {}
+        matched_new = set(matches.values())
+        for nid in new["all_nodes"]:
+            if nid not in matched_new and nid in new[key]:
+                unmatched_new.setdefault(new[key][nid], deque()).append(nid)
+        for nid in old["all_nodes"]:
+            if nid in matches or nid not in old[key]:
+                continue
+            candidates = unmatched_new.get(old[key][nid])
+            if candidates:
+                new_id = candidates.popleft()
+                matches[nid] = new_id
+                changes.append({"change": "matched", "node_id": new_id, "node_name": new["all_nodes"][new_id]["name"],
+                                "old_id": nid, "by": "structure" if key == "tree" else "content"})
+
+    matched_new = set(matches.values())
+    for nid, node in old["all_nodes"].items():
+        if nid not in matches:
+            changes.append({"change": "removed", "node_id": nid, "node_name": node["name"]})
+    for nid, node in new["all_nodes"].items():
+        if nid not in matched_new:
+            changes.append({"change": "added", "node_id": nid, "node_name": node["name"]})
+
+    matched_refs = {nid: nid for nid in matched_new}
+    for old_id, new_id in matches.items():
+        old_node = old["all_nodes"][old_id]
+        new_node = new["all_nodes"][new_id]
+        old_links = {matches.get(prev, prev) for prev in old_node["links"]}
+        new_links = set(new_node["links"])
+        if old_links != new_links:
+            changes.append({"change": "relinked", "node_id": new_id, "node_name": new_node["name"],
+                            "linked": diff_link_names(new_links - old_links, new, old),
+                            "unlinked": diff_link_names(old_links - new_links, new, old)})
+        # Subtree hashes only see the content of referenced nodes, so inputs
+        # are always compared through the node matching
+        changed = diff_inputs(args, old["raw"][old_id], new["raw"][new_id], matches, matched_refs)
+        if changed:
+            changes.append({"change": "inputs", "node_id": new_id, "node_name": new_node["name"],
+                            "inputs": changed})
+    return changes
+
+
+def format_change(change):
+    name = change["node_name"]
+    if change["change"] == "matched":
+        return f"matched \"{name}\" by {change['by']} (id {change['old_id']} -> {change['node_id']})"
+    if change["change"] == "relinked":
+        linked = ", ".join(f"+\"{n}\"" for n in change["linked"])
+        unlinked = ", ".join(f"-\"{n}\"" for n in change["unlinked"])
+        return f"relinked \"{name}\" : {' '.join(part for part in (linked, unlinked) if part)}"
+    if change["change"] == "inputs":
+        return f"inputs changed \"{name}\" : {', '.join(change['inputs'])}"
+    return f"{change['change']} \"{name}\" (id {change['node_id']})"
+
+
+def process_diff(args):
+    old_path, new_path = args.diff
+    try:
+        old_pipelines = {pipeline.get("id"): pipeline for pipeline in iter_pipelines(args, old_path)}
+        seen = set()
+        records = []
+        for new_pipeline in iter_pipelines(args, new_path):
+            pid = new_pipeline.get("id")
+            old_pipeline = old_pipelines.get(pid)
+            if old_pipeline is None:
+                records.append({"pipeline_id": pid, "change": "pipeline added"})
+                continue
+            seen.add(pid)
+            for change in diff_pipeline(args, old_pipeline, new_pipeline):
+                change["pipeline_id"] = pid
+                records.append(change)
+        for pid in old_pipelines:
+            if pid not in seen:
+                records.append({"pipeline_id": pid, "change": "pipeline removed"})
+    except ValueError as e:
+        log(args, e)
+        exit(1)
+
+    if args.output_format == "ndjson":
+        for record in records:
+            print(json.dumps(record, default=str))
+    elif args.output_format == "csv":
+        out = csv.writer(sys.stdout)
+        out.writerow(["pipeline_id", "change", "node_id", "node_name", "detail"])
+        for record in records:
+            out.writerow([record["pipeline_id"], record["change"], record.get("node_id", ""),
+                          record.get("node_name", ""), format_change(record) if "node_name" in record else ""])
+    else:
+        for record in records:
+            if "node_name" in record:
+                print(f"pipeline {record['pipeline_id']} : {format_change(record)}")
+            else:
+                print(f"pipeline {record['pipeline_id']} : {record['change']}")
+    log(args, f"changes {len(records)}")
+
+
+class FlowGraphCache:
+    """LRU cache of loaded flows and their indexes, reloaded when the file changes."""
+
+    def __init__(self, args, max_flows):
+        self.args = args
+        self.max_flows = max_flows
+        self.flows = OrderedDict()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime
+        flow = self.flows.get(path)
+        if flow is not None and flow["mtime"] == mtime:
+            self.flows.move_to_end(path)
+            return flow
+        pipelines = OrderedDict()
+        for pid, all_nodes in iter_node_sets(self.args, path):
+            pipelines[pid] = {
+                "all_nodes": all_nodes,
+                "index": build_ancestor_index(self.args, all_nodes),
+                "by_name": index_node_names(all_nodes),
+                "impact_index": None
+            }
+        flow = {"mtime": mtime, "pipelines": pipelines}
+        self.flows[path] = flow
+        self.flows.move_to_end(path)
+        while len(self.flows) > self.max_flows:
+            self.flows.popitem(last=False)
+        return flow
+
+
+def iter_query_pipelines(flow, params):
+    pid = params.get("pipeline")
+    for pipeline_id, graph in flow["pipelines"].items():
+        if pid is None or pid == pipeline_id:
+            yield pipeline_id, graph
+
+
+def resolve_node(graph, query):
+    if query in graph["all_nodes"]:
+        return query
+    return graph["by_name"].get(query)
+
+
+def handle_query(args, cache, command, params):
+    """Answer a load, hazards, reach or impact query against a cached flow."""
+    if command not in ("load", "hazards", "reach", "impact"):
+        raise ValueError(f"unknown query {command}")
+    if not params.get("file"):
+        raise ValueError("missing file")
+    flow = cache.get(params["file"])
+
+    if command == "load":
+        return {"pipelines": {pid: sum(1 for node in graph["all_nodes"].values() if not node.get("boundary"))
+                              for pid, graph in flow["pipelines"].items()}}
+
+    if command == "hazards":
+        rule_names = parse_rules(params.get("rules") or DEFAULT_RULES)
+        unknown = [name for name in rule_names if name not in RULES]
+        if unknown:
+            raise ValueError(f"unknown rules {', '.join(unknown)}")
+        findings = []
+        for pid, graph in iter_query_pipelines(flow, params):
+            findings.extend(run_rules(args, pid, graph["all_nodes"], graph["index"], rule_names))
+        return {"findings": findings}
+
+    answers = []
+    if command == "reach":
+        for pid, graph in iter_query_pipelines(flow, params):
+            source = resolve_node(graph, params.get("from", ""))
+            target = resolve_node(graph, params.get("to", ""))
+            if source is None or target is None:
+                continue
+            node = graph["all_nodes"][target]
+            found, via_any = follow_link(args, graph["index"], node, source)
+            sequencers = sequencers_on_path(args, graph["index"], node, source) if via_any else []
+            answers.append({"pipeline_id": pid, "from": source, "to": target, "reachable": found,
+                            "via_wait_any": via_any, "sequencer_ids": sequencers})
+        return {"answers": answers}
+
+    for pid, graph in iter_query_pipelines(flow, params):
+        node_id = resolve_node(graph, params.get("node", ""))
+        if node_id is None:
+            continue
+        if graph["impact_index"] is None:
+            graph["impact_index"] = build_impact_index(args, graph["all_nodes"])
+        affected = query_impact(args, graph["all_nodes"], graph["impact_index"], node_id)
+        answers.append({"pipeline_id": pid, "node_id": node_id, "affected": affected})
+    return {"answers": answers}
+
+
+def serve_http(args, cache):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, body = 200, handle_query(args, cache, url.path.strip("/"), params)
+            except (OSError, ValueError) as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                # A malformed flow must not take the server down
+                status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+            payload = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *log_args):
+            if args.debug:
+                super().log_message(format, *log_args)
+
+    # Single-threaded on purpose: queries are short and the cache is not locked
+    server = HTTPServer(("127.0.0.1", args.serve), QueryHandler)
+    print(f"serving flow queries on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def serve_repl(args, cache):
+    print("commands: load <file> | hazards <file> [rules] | reach <file> <from> <to> | impact <file> <node> | quit",
+          flush=True)
+    for line in sys.stdin:
+        words = line.split()
+        if not words:
+            continue
+        command, rest = words[0], words[1:]
+        if command in ("quit", "exit"):
+            break
+        names = {"hazards": ["file", "rules"], "reach": ["file", "from", "to"], "impact": ["file", "node"]}
+        params = dict(zip(names.get(command, ["file"]), rest))
+        try:
+            body = handle_query(args, cache, command, params)
+        except (OSError, ValueError) as e:
+            body = {"error": str(e)}
+        except Exception as e:
+            # A malformed flow must not end the session
+            body = {"error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(body, default=str), flush=True)
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--pipeline-id", type=str, help="pipeline-id")
     parser.add_argument("--pipeline-file", type=str, help="pipeline-id")
+    parser.add_argument("--stream", action='store_true',
+                        help="Read the pipelines array one element at a time instead of loading the whole file")
+    parser.add_argument("--pipeline-dir", type=str, help="Directory with saved pipeline json files")
+    parser.add_argument("--pipeline-glob", type=str,
+                        help="File pattern, matched under --pipeline-dir (default: *.json) or on its own")
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Default: number of CPUs")
+    parser.add_argument("--cache-dir", type=str,
+                        help="Directory for cached per-pipeline results; unchanged pipelines are not re-analyzed")
+    parser.add_argument("--cache-max-mb", type=int, default=256,
+                        help="Size limit of --cache-dir, least recently used entries are evicted. Default: 256")
+    parser.add_argument("--rules", type=str, default=DEFAULT_RULES,
+                        help=f"Comma separated checks to run, or 'all'. Available: {', '.join(RULES)}. Default: {DEFAULT_RULES}")
+    parser.add_argument("--cost-file", type=str,
+                        help="JSON or CSV (node,cost) file with per-node durations for the critical-path rule")
+    parser.add_argument("--output-format", choices=["text", "ndjson", "csv"], default="text",
+                        help="text report, or one ndjson/csv record per finding written as it is found. Default: text")
+    parser.add_argument("--impact", type=str,
+                        help="Comma separated node ids or names; list the nodes affected by each of them. "
+                             "With --unified, node ids have the form <pipeline id>/<node id>")
+    parser.add_argument("--impact-file", type=str,
+                        help="File with one node id or name per line for --impact, ids as for --impact")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                        help="Keep flows loaded and answer queries over HTTP on 127.0.0.1:PORT (0 picks a free port)")
+    parser.add_argument("--repl", action='store_true', help="Keep flows loaded and answer queries read from stdin")
+    parser.add_argument("--max-flows", type=int, default=16,
+                        help="Number of flows kept loaded by --serve/--repl. Default: 16")
+    parser.add_argument("--debug", action='store_true', help="Log every request in --serve mode")
+    parser.add_argument("--fragments", action='store_true',
+                        help="Report sub-flows that are duplicated across the given pipeline file(s)")
+    parser.add_argument("--min-fragment-size", type=int, default=3,
+                        help="Smallest fragment, in nodes, reported by --fragments. Default: 3")
+    parser.add_argument("--fragment-depth", type=int, default=6,
+                        help="Links followed from a node for the bounded fragments of --fragments; "
+                             "longer fragments are matched only when they reach the start or end of a pipeline. "
+                             "Default: 6")
+    parser.add_argument("--diff", type=str, nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two saved versions of a flow")
+    parser.add_argument("--unified", action='store_true',
+                        help="Analyze all pipelines of a flow as one graph, expanding supernodes into their sub-pipelines")
+    return parser
+
 
-    args = parser.parse_args()
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+
+    unknown = [name for name in selected_rules(args) if name not in RULES]
+    if unknown:
+        print(f"Unknown rules: {', '.join(unknown)}. Available: {', '.join(RULES)}")
+        exit(1)
+
+    if args.serve is not None or args.repl:
+        cache = FlowGraphCache(args, args.max_flows)
+        if args.serve is not None:
+            serve_http(args, cache)
+        else:
+            serve_repl(args, cache)
+        exit(0)
+
+    if args.fragments:
+        process_fragments(args)
+        exit(0)
+
+    if args.diff is not None:
+        process_diff(args)
+        exit(0)
+
+    if args.pipeline_dir is not None or args.pipeline_glob is not None:
+        if args.impact is not None or args.impact_file is not None:
+            print("--impact and --impact-file take a single --pipeline-file, not --pipeline-dir or --pipeline-glob")
+            exit(1)
+        process_pipeline_dir(args)
+        exit(0)
 
     if args.pipeline_id is None and args.pipeline_file is None:
         print(f"Missing ----pipeline-file parameter. Provide path to saved pipeline")
         exit(1)
 
+    if args.impact is not None or args.impact_file is not None:
+        process_impact(args)
+        exit(0)
+
     process_pipeline_file(args)
 
 
@@ -1,6 +1,10 @@
 """
 The script updates the 'sender' parameter in send-email nodes.
 
+By default the CPD APIs are called directly over a pooled HTTP session,
+which needs the requests package. Pass --backend cpdctl to run every call through the cpdctl CLI instead
+(cpdctl must then be on the PATH).
+
 Scenarios:
 
 1. Project-Wide Update
@@ -62,6 +66,25 @@ Scenarios:
          --project-name MyProject \
          --path /path/to/file.txt
 
+   Both project-wide modes accept --workers N to fetch, update and upload up to
+   N pipelines at the same time. --max-host-requests caps the number of requests
+   in flight against the host (default 4). Log lines of each pipeline are
+   written out together once that pipeline is done, and a summary of updated,
+   skipped and failed pipelines closes the run.
+
+   Pipelines whose 'Send email' nodes already carry the requested sender
+   expression are skipped, so re-running the same update uploads nothing.
+
+   --cache-dir keeps downloaded flows on disk, keyed by pipeline ID and the
+   version listed by the server. Unchanged pipelines are not downloaded again,
+   and --cache-max-mb bounds the size of the cached flows (default 256). With --offline
+   the run is planned from the cache alone: --host, --username and --password
+   are not needed and uploads are only reported.
+
+   With --validate every uploaded pipeline is fetched again in batches on a
+   background executor while the run continues, and nodes that do not carry
+   the expected expression are reported at the end.
+
 3. Single Pipeline Update
 
    Updates the sender parameter in a specific pipeline within the project.
@@ -90,6 +113,37 @@ Scenarios:
          --project-name MyProject \
          --pipeline-name PipelineA \
          --sender-value #sender_param_name#
+
+4. Rule-based Input Update
+
+   Sets any input of any node type from a rules file, so that several mass edits
+   are applied with one download and one upload per pipeline. Every rule names
+   a node type (the componentLabelRef, or * for any type), a node name pattern
+   (* and ? wildcards), the input to set and a value in the sender value format
+   described above. When several rules target the same input of a node, the
+   first one in the file wins.
+
+   Required arguments:
+     --host           URL of the server or service
+     --username       Authentication username
+     --password       Authentication password
+     --project-name   Name of the project to update
+     --rules-file     CSV or YAML file with the rules (YAML needs PyYAML)
+
+   Optional: --pipeline-name to update a single pipeline, --workers N.
+
+   Example (CSV file contents):
+     node_type,name_pattern,input_name,value_template
+     Send email,*,sender_addr,#sender_set.sender_addr#
+     Run Bash script,Cleanup*,working_dir,/data/#env_name#/tmp
+
+   Example command:
+     python update_sender.py rules \
+         --host https://cpd-cpd-instance.cp.fyre.ibm.com \
+         --username admin \
+         --password secret \
+         --project-name MyProject \
+         --rules-file /path/to/rules.csv
 """
 import os
 import sys
@@ -102,10 +156,31 @@ import re
 import csv
 import zipfile
 import shutil
+import fnmatch
+import glob
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, List, Any, Union, Optional
+from typing import Dict, List, Any, Union, Optional, Set, Tuple, FrozenSet
+
+try:
+    import requests
+    import urllib3
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+if requests is not None:
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 JSONType = Union[Dict[str, Any], List[Any]]
 
@@ -113,6 +188,13 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DEBUG_DIR = os.path.join(SCRIPT_DIR, "debug_temp")
 
+DEFAULT_MAX_HOST_REQUESTS = 4
+
+DEFAULT_CACHE_MAX_MB = 256
+
+VALIDATION_BATCH_SIZE = 10
+VALIDATION_WORKERS = 2
+
 timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
 DEBUG_ARCHIVE_NAME = os.path.join(SCRIPT_DIR, f"debug_update_sender_logs_{timestamp}.zip")
 
@@ -131,21 +213,40 @@ class UpdateInstruction:
     raw_value: str
 
 
+VARIABLE_RE = re.compile(r'#([^#]+)#')
+
+RESOLVE_CACHE_SIZE = 4096
+
+FlowContext = Dict[str, FrozenSet[str]]
+
+
+@functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def compile_template(input_value: str) -> Tuple[Tuple[bool, str], ...]:
+    """Splits a value template once into (is_variable, text) parts."""
+    return tuple((i % 2 == 1, token) for i, token in enumerate(VARIABLE_RE.split(input_value)))
+
+
 class ExpressionResolver:
 
-    def __init__(self, flow_context: Dict[str, List[str]]):
+    def __init__(self, flow_context: FlowContext):
         self.context = flow_context
+        # Flows sharing variables, parameter sets and parameters share resolutions
+        self._fingerprint = (flow_context["user_vars"], flow_context["param_sets"], flow_context["pipeline_params"])
 
     def resolve(self, input_value: str) -> str:
-        parts = re.split(r'#([^#]+)#', input_value)
+        return _resolve_cached(input_value, self._fingerprint)
+
+    @staticmethod
+    def _resolve(input_value: str, user_vars: FrozenSet[str], param_sets: FrozenSet[str],
+                 pipeline_params: FrozenSet[str]) -> str:
         expression_parts = []
 
-        for i, token in enumerate(parts):
-            if i % 2 == 0:
+        for is_variable, token in compile_template(input_value):
+            if not is_variable:
                 if token:
                     expression_parts.append(json.dumps(token))
             else:
-                resolved = self._resolve_single_variable(token)
+                resolved = ExpressionResolver._resolve_single_variable(token, user_vars, param_sets, pipeline_params)
                 if resolved:
                     expression_parts.append(resolved)
                 else:
@@ -156,36 +257,45 @@ class ExpressionResolver:
 
         return " + ".join(expression_parts)
 
-    def _resolve_single_variable(self, token: str) -> Optional[str]:
+    @staticmethod
+    def _resolve_single_variable(token: str, user_vars: FrozenSet[str], param_sets: FrozenSet[str],
+                                 pipeline_params: FrozenSet[str]) -> Optional[str]:
 
         # After-migration usr var format
         migrated_var_name = token.replace(".", "_")
-        if migrated_var_name in self.context["user_vars"]:
+        if migrated_var_name in user_vars:
             return f'vars.{migrated_var_name}'
 
         # User variables
         if token.startswith("UsrVar."):
             var_name = token.split(".", 1)[1]
-            if var_name in self.context["user_vars"]:
+            if var_name in user_vars:
                 return f'vars.{var_name}'
 
         # Parameter sets
         if "." in token:
             set_name, param_name = token.split(".", 1)
-            if set_name in self.context["param_sets"]:
+            if set_name in param_sets:
                 return f'param_sets.{set_name}["{param_name}"]'
 
         # Pipeline Parameters
-        if token in self.context["pipeline_params"]:
+        if token in pipeline_params:
             return f'params["{token}"]'
 
         return None
 
 
+@functools.lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def _resolve_cached(input_value: str, fingerprint: Tuple[FrozenSet[str], ...]) -> str:
+    return ExpressionResolver._resolve(input_value, *fingerprint)
+
+
 class CPDClient:
 
-    def __init__(self, host: str, username: str, password: str):
+    def __init__(self, host: str, username: str, password: str,
+                 max_requests: int = DEFAULT_MAX_HOST_REQUESTS):
         self._env = os.environ.copy()
+        self._limit = threading.BoundedSemaphore(max_requests)
         self._config_file = self._setup_config(host, username, password)
 
     def _setup_config(self, host: str, username: str, password: str) -> str:
@@ -210,13 +320,14 @@ class CPDClient:
 
     def _exec(self, args: list[str]) -> bytes:
         logger.debug(f"Executing: {' '.join(args[:4])} ...")
-        p = subprocess.Popen(
-            args=args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=self._env
-        )
-        stdout, stderr = p.communicate()
+        with self._limit:
+            p = subprocess.Popen(
+                args=args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=self._env
+            )
+            stdout, stderr = p.communicate()
 
         if p.returncode != 0:
             err_msg = stderr.decode().strip()
@@ -264,8 +375,9 @@ class CPDClient:
             raise ValueError("Response did not contain 'flow' key.")
 
     def upload_pipeline_flow(self, flow: JSONType, project_id: str, pipeline_id: str):
+        # cpdctl only uploads from a file, the HTTP client sends the body from memory
         with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.json') as tmp:
-            json.dump(flow, tmp, indent=2)
+            json.dump(flow, tmp, separators=(',', ':'))
             tmp_path = tmp.name
 
         logger.info(f"Uploading updated flow for pipeline ID: {pipeline_id}")
@@ -291,25 +403,402 @@ class CPDClient:
                 pass
 
 
+class CPDHttpClient:
+    """Calls the CPD REST APIs over one pooled HTTP session; same methods as CPDClient."""
+
+    def __init__(self, host: str, username: str, password: str,
+                 max_requests: int = DEFAULT_MAX_HOST_REQUESTS):
+        self._host = host.rstrip("/")
+        self._username = username
+        self._password = password
+        # One host per run, so this caps the requests in flight against it
+        self._limit = threading.BoundedSemaphore(max_requests)
+        self._auth_lock = threading.Lock()
+        self._session = requests.Session()
+        retry = urllib3.Retry(total=3, connect=3, backoff_factor=0.5, status_forcelist=[502, 503, 504],
+                              allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_requests, max_retries=retry)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.verify = False
+        self._token = self._authenticate()
+
+    def _authenticate(self) -> str:
+        response = self._session.post(
+            f"{self._host}/icp4d-api/v1/authorize",
+            json={"username": self._username, "password": self._password},
+            headers={"cache-control": "no-cache"}
+        )
+        token = response.json().get("token") if response.ok else None
+        if token:
+            return token
+
+        # Clusters fronted by IAM only accept the common services token exchange
+        logger.debug("icp4d authorize failed, trying IAM token exchange")
+        common_service_url = self._host.replace("cpd-zen", "cp-console")
+        response = self._session.post(
+            f"{common_service_url}/v1/auth/identitytoken",
+            data={"grant_type": "password", "username": self._username,
+                  "password": self._password, "scope": "openid"}
+        )
+        if not response.ok:
+            raise RuntimeError(f"Unable to generate IAM access token: {response.text}")
+        response = self._session.get(
+            f"{self._host}/v1/preauth/validateAuth",
+            headers={"username": self._username, "iam-token": response.json().get("access_token")}
+        )
+        if not response.ok:
+            raise RuntimeError(f"Unable to generate ZEN access token: {response.text}")
+        return response.json().get("accessToken")
+
+    def _request(self, method: str, path: str, project_id: Optional[str] = None, **kwargs) -> "requests.Response":
+        logger.debug(f"Request: {method} {path}")
+        for attempt in range(2):
+            token = self._token
+            headers = {"Authorization": f"Bearer {token}"}
+            if project_id:
+                headers["Project-ID"] = project_id
+            with self._limit:
+                response = self._session.request(method, f"{self._host}{path}", headers=headers, **kwargs)
+            if response.status_code == 401 and attempt == 0:
+                with self._auth_lock:
+                    # Another worker may already have refreshed it
+                    if self._token == token:
+                        logger.debug("Token expired, authenticating again")
+                        self._token = self._authenticate()
+                continue
+            break
+
+        if not response.ok:
+            logger.error(f"Request failed: {method} {path}: {response.status_code} {response.text}")
+            raise RuntimeError(f"{method} {path} failed with status {response.status_code}: {response.text}")
+        return response
+
+    def get_project_id(self, project_name: str) -> Optional[str]:
+        data = self._request("GET", "/v2/projects", params={"name": project_name}).json()
+        for project in data.get("resources", []):
+            if project.get("entity", {}).get("name", project_name) == project_name:
+                return project["metadata"]["guid"]
+        return None
+
+    def list_pipelines(self, project_id: str) -> List[Dict]:
+        pipelines = []
+        page_token = None
+        while True:
+            params = {"page_size": 100}
+            if page_token:
+                params["page_token"] = page_token
+            result = self._request("GET", "/apis/v1/pipelines", project_id=project_id, params=params).json()
+            pipelines.extend(result.get("pipelines", []))
+            page_token = result.get("next_page_token")
+            if not page_token:
+                break
+        return pipelines
+
+    def get_pipeline_flow(self, project_id: str, pipeline_id: str) -> JSONType:
+        full_response = self._request(
+            "GET", f"/apis/v1/pipelines/{pipeline_id}/templates", project_id=project_id,
+            params={"format": "flow", "version": "any"}
+        ).json()
+        if "flow" in full_response:
+            return json.loads(full_response["flow"])
+        else:
+            raise ValueError("Response did not contain 'flow' key.")
+
+    def upload_pipeline_flow(self, flow: JSONType, project_id: str, pipeline_id: str):
+        logger.info(f"Uploading updated flow for pipeline ID: {pipeline_id}")
+        params = {
+            "name": f"update_sender_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}",
+            "pipelineid": pipeline_id,
+            "volatile": "true"
+        }
+        body = json.dumps(flow, separators=(',', ':')).encode("utf-8")
+        self._request(
+            "POST", "/apis/v1/pipelines/upload_version", project_id=project_id,
+            params=params, files={"uploadfile": (f"{pipeline_id}.json", body, "application/json")}
+        )
+        logger.info(f"Successfully uploaded updated flow for pipeline ID: {pipeline_id}")
+
+    def cleanup(self):
+        self._session.close()
+
+
+def pipeline_stamp(pipeline: Dict) -> Optional[str]:
+    """Identifies the server copy of a pipeline from its list entry, None when it has no version data."""
+    version = pipeline.get("default_version") or {}
+    if not version.get("id") and not version.get("created_at"):
+        return None
+    return json.dumps([version.get("id"), version.get("created_at"), pipeline.get("updated_at")])
+
+
+class FlowCache:
+    """Downloaded flows, project map and pipeline lists on disk; max_mb bounds the flows only."""
+
+    def __init__(self, cache_dir: str, max_mb: int = DEFAULT_CACHE_MAX_MB):
+        self._dir = cache_dir
+        self._max_bytes = max_mb * 1024 * 1024
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self._dir, *parts)
+
+    def _read(self, path: str) -> Optional[Any]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path: str, data: Any):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+
+    def get_flow(self, pipeline_id: str, stamp: Optional[str] = None) -> Optional[JSONType]:
+        path = self._path("flows", f"{pipeline_id}.json")
+        entry = self._read(path)
+        if entry is None or (stamp is not None and entry.get("stamp") != stamp):
+            return None
+        # evict() orders flows by mtime, so a flow that was just used is kept longest
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("flow")
+
+    def put_flow(self, pipeline_id: str, stamp: Optional[str], flow: JSONType):
+        self._write(self._path("flows", f"{pipeline_id}.json"), {"stamp": stamp, "flow": flow})
+
+    def drop_flow(self, pipeline_id: str):
+        try:
+            os.remove(self._path("flows", f"{pipeline_id}.json"))
+        except OSError:
+            pass
+
+    def get_project_id(self, project_name: str) -> Optional[str]:
+        return (self._read(self._path("projects.json")) or {}).get(project_name)
+
+    def put_project_id(self, project_name: str, project_id: str):
+        projects = self._read(self._path("projects.json")) or {}
+        projects[project_name] = project_id
+        self._write(self._path("projects.json"), projects)
+
+    def get_pipelines(self, project_id: str) -> Optional[List[Dict]]:
+        return self._read(self._path("pipelines", f"{project_id}.json"))
+
+    def put_pipelines(self, project_id: str, pipelines: List[Dict]):
+        self._write(self._path("pipelines", f"{project_id}.json"), pipelines)
+
+    def evict(self):
+        # Only flows count toward max_mb and are removed, oldest first; the project map
+        # and pipeline lists are small and --offline cannot plan a project without them
+        entries = []
+        total = 0
+        flows_dir = self._path("flows")
+        if not os.path.isdir(flows_dir):
+            return
+        for name in os.listdir(flows_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(flows_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class CachedClient:
+    """Serves flows from a FlowCache while the server lists the same pipeline version."""
+
+    def __init__(self, client, cache: FlowCache):
+        self._client = client
+        self._cache = cache
+        self._stamps = {}
+        self._uploaded = set()
+
+    def get_project_id(self, project_name: str) -> Optional[str]:
+        project_id = self._client.get_project_id(project_name)
+        if project_id:
+            self._cache.put_project_id(project_name, project_id)
+        return project_id
+
+    def list_pipelines(self, project_id: str) -> List[Dict]:
+        pipelines = self._client.list_pipelines(project_id)
+        self._stamps.update((p["id"], pipeline_stamp(p)) for p in pipelines)
+        self._cache.put_pipelines(project_id, pipelines)
+        return pipelines
+
+    def get_pipeline_flow(self, project_id: str, pipeline_id: str) -> JSONType:
+        stamp = self._stamps.get(pipeline_id)
+        cacheable = stamp is not None and pipeline_id not in self._uploaded
+        if cacheable:
+            flow = self._cache.get_flow(pipeline_id, stamp)
+            if flow is not None:
+                logger.debug(f"Using cached flow for pipeline ID: {pipeline_id}")
+                return flow
+
+        flow = self._client.get_pipeline_flow(project_id, pipeline_id)
+        if cacheable:
+            self._cache.put_flow(pipeline_id, stamp, flow)
+        return flow
+
+    def upload_pipeline_flow(self, flow: JSONType, project_id: str, pipeline_id: str):
+        self._uploaded.add(pipeline_id)
+        self._cache.drop_flow(pipeline_id)
+        self._client.upload_pipeline_flow(flow, project_id, pipeline_id)
+        # The new version's stamp is unknown until the next listing, so online
+        # runs refetch it while --offline still sees what was uploaded
+        self._cache.put_flow(pipeline_id, None, flow)
+
+    def cleanup(self):
+        self._cache.evict()
+        self._client.cleanup()
+
+
+class OfflineClient:
+    """Serves everything from a FlowCache and only reports uploads."""
+
+    def __init__(self, cache: FlowCache):
+        self._cache = cache
+
+    def get_project_id(self, project_name: str) -> Optional[str]:
+        return self._cache.get_project_id(project_name)
+
+    def list_pipelines(self, project_id: str) -> List[Dict]:
+        pipelines = self._cache.get_pipelines(project_id)
+        if pipelines is None:
+            raise ValueError(f"No cached pipeline list for project ID {project_id}, run once online first.")
+        return pipelines
+
+    def get_pipeline_flow(self, project_id: str, pipeline_id: str) -> JSONType:
+        flow = self._cache.get_flow(pipeline_id)
+        if flow is None:
+            raise ValueError(f"Flow of pipeline ID {pipeline_id} is not in the cache.")
+        return flow
+
+    def upload_pipeline_flow(self, flow: JSONType, project_id: str, pipeline_id: str):
+        logger.info(f"[offline] Would upload updated flow for pipeline ID: {pipeline_id}")
+
+    def cleanup(self):
+        pass
+
+
+Client = Union[CPDClient, CPDHttpClient, CachedClient, OfflineClient]
+
+
+def create_client(args) -> Client:
+    if args.offline:
+        return OfflineClient(FlowCache(args.cache_dir, args.cache_max_mb))
+
+    if args.backend == "cpdctl":
+        client = CPDClient(args.host, args.username, args.password, args.max_host_requests)
+    else:
+        if requests is None:
+            logger.error("The requests package is required for --backend http, install it or use --backend cpdctl.")
+            sys.exit(1)
+        client = CPDHttpClient(args.host, args.username, args.password, args.max_host_requests)
+
+    if args.cache_dir:
+        return CachedClient(client, FlowCache(args.cache_dir, args.cache_max_mb))
+    return client
+
+
+SEND_EMAIL_NODE_TYPE = "Send email"
+SENDER_INPUT_NAME = "sender_addr"
+
+RULE_FIELDS = ("node_type", "name_pattern", "input_name", "value_template")
+
+# (pipeline id, node id, node name, input name); the ids identify the node, the name is for reporting
+ChangeKey = Tuple[str, str, str, str]
+
+IndexedNode = Tuple[str, str, str, Dict]
+
+
+@dataclass
+class UpdateRule:
+    """Sets input_name on nodes of node_type ('*' for any) whose name matches name_pattern."""
+    node_type: str
+    name_pattern: str
+    input_name: str
+    value_template: str
+
+    def matches(self, node_name: str) -> bool:
+        return fnmatch.fnmatchcase(node_name, self.name_pattern)
+
+
+def sender_rules(updates: Dict[Union[str, None], str]) -> List[UpdateRule]:
+    """Turns a node name -> sender value map (None for all nodes) into Send email rules."""
+    rules = [UpdateRule(SEND_EMAIL_NODE_TYPE, glob.escape(name), SENDER_INPUT_NAME, value)
+             for name, value in updates.items() if name is not None and value]
+    # Node specific values come first so that they win over the project-wide one
+    if updates.get(None):
+        rules.append(UpdateRule(SEND_EMAIL_NODE_TYPE, "*", SENDER_INPUT_NAME, updates[None]))
+    return rules
+
+
+def build_node_index(flow: JSONType) -> Dict[str, List[IndexedNode]]:
+    """Nodes of the flow as (pipeline id, node id, name, pipeline_data), grouped by componentLabelRef."""
+    index = defaultdict(list)
+    for pipeline in flow.get("pipelines", []):
+        for node in pipeline.get("nodes", []):
+            app_data = node.get("app_data", {})
+
+            node_pipeline_data = app_data.get("pipeline_data", {})
+            node_ui_data = app_data.get("ui_data", {})
+
+            node_name = node_pipeline_data.get("descriptive_name", "") or node_ui_data.get("label", "")
+            index[app_data.get("componentLabelRef", "")].append(
+                (pipeline.get("id", ""), node.get("id", ""), node_name, node_pipeline_data))
+    return index
+
+
+def iter_indexed_nodes(index: Dict[str, List[IndexedNode]], node_type: str):
+    if node_type == "*":
+        for nodes in index.values():
+            yield from nodes
+    else:
+        yield from index.get(node_type, [])
+
+
 class PipelineProcessor:
 
     def __init__(self, flow: JSONType):
         self.flow = flow
+        # ChangeKey -> expression, for inputs that were changed
+        self.applied = {}
+        # Keys of matched inputs that already carried the requested expression
+        self.unchanged = set()
         self.context = self._extract_context(flow)
         self.resolver = ExpressionResolver(self.context)
+        self.index = build_node_index(flow)
 
-    def _extract_context(self, flow: JSONType) -> Dict[str, List[str]]:
+    def _extract_context(self, flow: JSONType) -> FlowContext:
         app_data = flow.get("app_data", {})
         pipeline_data = app_data.get("pipeline_data", {})
 
-        user_vars = [v["name"] for v in pipeline_data.get("variables", [])]
-        param_sets = [p["name"] for p in pipeline_data.get("parameter_sets", [])]
+        user_vars = frozenset(v["name"] for v in pipeline_data.get("variables", []))
+        param_sets = frozenset(p["name"] for p in pipeline_data.get("parameter_sets", []))
 
         primary_id = flow.get("primary_pipeline", "")
         pipelines = flow.get("pipelines", [])
         primary_pipe = next((p for p in pipelines if p.get("id") == primary_id), {})
         pp_data = primary_pipe.get("app_data", {}).get("pipeline_data", {})
-        pipeline_params = [p["name"] for p in pp_data.get("inputs", [])]
+        pipeline_params = frozenset(p["name"] for p in pp_data.get("inputs", []))
 
         ctx = {
             "user_vars": user_vars,
@@ -321,53 +810,165 @@ class PipelineProcessor:
 
         return ctx
 
-    def update_send_email_nodes(self, updates: Dict[Union[str, None], str]) -> Dict[str, str]:
-
+    def apply_rules(self, rules: List[UpdateRule]) -> Dict[ChangeKey, str]:
+        """Applies the rules through the node index; the first rule matching an input of a node wins."""
         applied_updates = {}
-        pipelines_list = self.flow.get("pipelines", [])
+        handled = set()
 
-        for pipeline in pipelines_list:
-            nodes = pipeline.get("nodes", [])
-            for node in nodes:
-                app_data = node.get("app_data", {})
-                if app_data.get("componentLabelRef") != "Send email":
+        for rule in rules:
+            for pipeline_id, node_id, node_name, node_data in iter_indexed_nodes(self.index, rule.node_type):
+                key = (pipeline_id, node_id, node_name, rule.input_name)
+                if key in handled or not rule.matches(node_name):
                     continue
+                handled.add(key)
 
-                node_pipeline_data = app_data.get("pipeline_data", {})
-                node_ui_data = app_data.get("ui_data", {})
-                
-                node_name = node_pipeline_data.get("descriptive_name", "") or node_ui_data.get("label", "")
-
-                target_value = updates.get(node_name) or updates.get(None)
+                try:
+                    expression = self.resolver.resolve(rule.value_template)
+                except ValueError as e:
+                    logger.error(f"Skipping node '{node_name}' in pipeline: {e}")
+                    raise
 
-                if target_value:
-                    try:
-                        expression = self.resolver.resolve(target_value)
-                        self._apply_update(node_pipeline_data, expression)
-                        logger.debug(f"Updated node '{node_name}' with expression: {expression}")
-
-                        applied_updates[node_name] = expression
+                changed = self._apply_update(node_data, expression, rule.input_name)
+                if changed is None:
+                    continue
+                if not changed:
+                    logger.debug(f"Node '{node_name}' already has {rule.input_name} expression: {expression}")
+                    self.unchanged.add(key)
+                    continue
+                logger.debug(f"Updated {rule.input_name} of node '{node_name}' with expression: {expression}")
 
-                    except ValueError as e:
-                        logger.error(f"Skipping node '{node_name}' in pipeline: {e}")
-                        raise
+                applied_updates[key] = expression
 
+        self.applied.update(applied_updates)
         return applied_updates
 
-    def _apply_update(self, node_data: Dict, expression: str):
+    def update_send_email_nodes(self, updates: Dict[Union[str, None], str]) -> Dict[str, str]:
+        applied_updates = self.apply_rules(sender_rules(updates))
+        return {node_name: expression for (_, _, node_name, _), expression in applied_updates.items()}
+
+    def _apply_update(self, node_data: Dict, expression: str,
+                      input_name: str = SENDER_INPUT_NAME) -> Optional[bool]:
+        """Sets the input expression and returns whether it changed, None when the node lacks the input."""
         inputs = node_data.get("inputs", [])
         for inp in inputs:
-            if inp.get("name") == "sender_addr":
+            if inp.get("name") == input_name:
+                if inp.get("value_from") == {"expression": expression} and "value" not in inp:
+                    return False
                 inp.pop("value", None)
                 inp.pop("ui_data", None)
                 inp["value_from"] = {"expression": expression}
-                return
-        logger.warning("Found 'Send email' node but 'sender_addr' input was missing.")
+                return True
+        logger.warning(f"Found matching node but '{input_name}' input was missing.")
+        return None
 
 
-def validate_pipeline_changes(client: CPDClient, project_id: str, pipeline_id: str,
-                              expected_changes: Dict[Union[str, None], str]):
-    pass
+def validate_pipeline_changes(client: Client, project_id: str, pipeline_id: str,
+                              expected_changes: Dict[ChangeKey, str]) -> List[str]:
+    """Re-fetches the pipeline and returns a message for every node input not carrying its expected expression."""
+    index = build_node_index(client.get_pipeline_flow(project_id, pipeline_id))
+    nodes = {(node[0], node[1]): node[3] for node in iter_indexed_nodes(index, "*")}
+
+    found = {}
+    for key in expected_changes:
+        node_data = nodes.get(key[:2])
+        if node_data is not None:
+            inp = next((inp for inp in node_data.get("inputs", []) if inp.get("name") == key[3]), {})
+            found[key] = inp.get("value_from", {}).get("expression")
+
+    mismatches = []
+    for key, expected in expected_changes.items():
+        node_name, input_name = key[2], key[3]
+        if key not in found:
+            mismatches.append(f"node '{node_name}' not found after upload")
+        elif found[key] != expected:
+            mismatches.append(f"{input_name} of node '{node_name}' has expression {found[key]!r}, "
+                              f"expected {expected!r}")
+    return mismatches
+
+
+class ChangeValidator:
+    """Re-fetches uploaded pipelines in batches in the background while the run goes on."""
+
+    def __init__(self, client: Client, project_id: str, batch_size: int = VALIDATION_BATCH_SIZE):
+        self._client = client
+        self._project_id = project_id
+        self._batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=VALIDATION_WORKERS)
+        self._futures = []
+
+    def submit(self, pipe_name: str, pipeline_id: str, expected_changes: Dict[ChangeKey, str]):
+        with self._lock:
+            self._pending.append((pipe_name, pipeline_id, expected_changes))
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._futures.append(self._executor.submit(self._validate_batch, self._pending))
+            self._pending = []
+
+    def _validate_batch(self, batch: List[tuple]) -> Dict[str, List[str]]:
+        mismatches = {}
+        for pipe_name, pipeline_id, expected_changes in batch:
+            try:
+                problems = validate_pipeline_changes(self._client, self._project_id, pipeline_id, expected_changes)
+            except Exception as e:
+                problems = [f"could not re-fetch flow: {e}"]
+            if problems:
+                mismatches[pipe_name] = problems
+        return mismatches
+
+    def finish(self) -> Dict[str, List[str]]:
+        with self._lock:
+            self._flush()
+            futures, self._futures = self._futures, []
+
+        mismatches = {}
+        for future in futures:
+            mismatches.update(future.result())
+        self._executor.shutdown(wait=True)
+        return mismatches
+
+    def report(self) -> List[str]:
+        mismatches = self.finish()
+        for pipe_name, problems in sorted(mismatches.items()):
+            for problem in problems:
+                logger.error(f"Validation failed for pipeline '{pipe_name}': {problem}")
+        if not mismatches:
+            logger.info("Validation passed for all uploaded pipelines.")
+        return sorted(mismatches)
+
+
+def parse_rules_file(file_path: str) -> List[UpdateRule]:
+    """Update rules from a CSV file or a YAML list with node_type,name_pattern,input_name,value_template."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File {file_path} not found.")
+
+    if file_path.lower().endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise ImportError("PyYAML is required to read YAML rules files, install it or use CSV.")
+        with open(file_path, 'r', encoding='utf-8') as f:
+            rows = yaml.safe_load(f) or []
+        if isinstance(rows, dict):
+            rows = rows.get("rules", [])
+    else:
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f, skipinitialspace=True))
+
+    rules = []
+    for i, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            logger.warning(f"Rule {i}: Expected a mapping, got {type(row).__name__}. Skipping.")
+            continue
+        values = {field: str(row.get(field) or "").strip() for field in RULE_FIELDS}
+        missing = [field for field in RULE_FIELDS if not values[field]]
+        if missing:
+            logger.warning(f"Rule {i}: Missing {', '.join(missing)}. Skipping.")
+            continue
+        rules.append(UpdateRule(**values))
+    return rules
 
 
 def parse_csv_file(file_path: str) -> List[UpdateInstruction]:
@@ -435,9 +1036,134 @@ def create_debug_archive():
             logger.info("Cleaned up temporary debug files.")
 
 
-def run_project_scenario(args, client: CPDClient, project_id: str):
+class PipelineLogBuffer(logging.Filter):
+    """Holds back a worker's log records so each pipeline's messages are written together."""
+
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        records = getattr(self._local, "records", None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    @contextmanager
+    def capture(self):
+        self._local.records = []
+        try:
+            yield self._local.records
+        finally:
+            self._local.records = None
+
+    @staticmethod
+    def flush(records: List[logging.LogRecord]):
+        for record in records:
+            logger.handle(record)
+
+
+def process_project_pipeline(args, client: Client, project_id: str, pipe_name: str, pid: str,
+                             rules: List[UpdateRule], requested_nodes: Set[str],
+                             validator: Optional[ChangeValidator] = None) -> str:
+    flow_data = None
+    try:
+        logger.info(f"Processing pipeline '{pipe_name}' (ID: {pid})...")
+        flow_data = client.get_pipeline_flow(project_id, pid)
+        processor = PipelineProcessor(flow_data)
+
+        applied_changes = processor.apply_rules(rules)
+
+        logger.debug(f"Mapped changes: {applied_changes}")
+
+        matched_nodes = {key[2] for key in applied_changes} | {key[2] for key in processor.unchanged}
+        missed_nodes = requested_nodes - matched_nodes
+        if missed_nodes:
+            logger.warning(f"Nodes requested but NOT found in '{pipe_name}': {missed_nodes}")
+            if args.debug and flow_data:
+                dump_failed_flow(flow_data, pipe_name, pid, "partial_miss")
+            return "partial_miss"
+
+        if not applied_changes and processor.unchanged:
+            logger.info(f"Pipeline '{pipe_name}' already up to date, skipping upload.")
+            return "skipped"
+
+        if not applied_changes:
+            if requested_nodes:
+                logger.info(f"No nodes matched or updated in pipeline '{pipe_name}'.")
+            else:
+                logger.info(f"No nodes matching the rules found in '{pipe_name}'.")
+            reason = "no_matches"
+            if args.debug and flow_data:
+                dump_failed_flow(flow_data, pipe_name, pid, reason)
+            return "no_changes"
+
+        client.upload_pipeline_flow(processor.flow, project_id, pid)
+        if validator:
+            validator.submit(pipe_name, pid, applied_changes)
+        return "updated"
+
+    except Exception as e:
+        logger.error(f"Failed to process pipeline '{pipe_name}': {e}", exc_info=True)
+        if args.debug and flow_data:
+            dump_failed_flow(flow_data, pipe_name, pid, "error")
+        return "failed"
+
+
+def run_pipeline_jobs(args, client: Client, project_id: str, jobs: List[tuple],
+                      validator: Optional[ChangeValidator] = None) -> Dict[str, List[str]]:
+    results = defaultdict(list)
+
+    if args.workers <= 1:
+        for job in jobs:
+            status = process_project_pipeline(args, client, project_id, *job, validator)
+            results[status].append(job[0])
+        return results
+
+    logger.info(f"Processing {len(jobs)} pipelines with {args.workers} workers "
+                f"(at most {args.max_host_requests} concurrent requests).")
+
+    log_buffer = PipelineLogBuffer()
+
+    def run(job):
+        with log_buffer.capture() as records:
+            status = process_project_pipeline(args, client, project_id, *job, validator)
+        return status, records
+
+    logger.addFilter(log_buffer)
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = {executor.submit(run, job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            status, records = future.result()
+            log_buffer.flush(records)
+            results[status].append(futures[future])
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        logger.removeFilter(log_buffer)
+
+    return results
+
+
+def log_summary(results: Dict[str, List[str]]):
+    counts = [f"{status}: {len(results.get(status, []))}" for status in ("updated", "skipped", "failed")]
+    counts += [f"{status}: {len(names)}" for status, names in sorted(results.items())
+               if status not in ("updated", "skipped", "failed")]
+    logger.info(f"Summary: {', '.join(counts)}")
+    if results.get("failed"):
+        logger.error(f"Failed pipelines: {', '.join(sorted(results['failed']))}")
+
+
+def run_project_scenario(args, client: Client, project_id: str):
     logger.info("Starting PROJECT scenario.")
 
+    jobs = []
+    results = defaultdict(list)
+
     if args.path:
         logger.info(f"Reading update file: {args.path}")
         instructions = parse_csv_file(args.path)
@@ -454,77 +1180,58 @@ def run_project_scenario(args, client: CPDClient, project_id: str):
         for pipe_name, instrs in updates_by_pipeline.items():
             if pipe_name not in name_to_id:
                 logger.error(f"Pipeline '{pipe_name}' found in file but not in project. Skipping.")
+                results["not_found"].append(pipe_name)
                 continue
 
-            pid = name_to_id[pipe_name]
-            logger.info(f"Processing pipeline '{pipe_name}' (ID: {pid})...")
-
-            flow_data = None
-            try:
-                flow_data = client.get_pipeline_flow(project_id, pid)
-                processor = PipelineProcessor(flow_data)
-
-                node_updates_input = {instr.node_name: instr.raw_value for instr in instrs}
+            node_updates_input = {instr.node_name: instr.raw_value for instr in instrs}
+            jobs.append((pipe_name, name_to_id[pipe_name], sender_rules(node_updates_input), set(node_updates_input)))
 
-                applied_changes = processor.update_send_email_nodes(node_updates_input)
+    else:
+        logger.info(f"Updating ALL pipelines with value: {args.sender_value}")
+        pipelines = client.list_pipelines(project_id)
 
-                requested_nodes = set(node_updates_input.keys())
-                updated_nodes = set(applied_changes.keys())
-                missed_nodes = requested_nodes - updated_nodes
+        rules = sender_rules({None: args.sender_value})
+        jobs = [(p["name"], p["id"], rules, set()) for p in pipelines]
 
-                logger.debug(f"Mapped changes: {applied_changes}")
+    run_jobs_and_report(args, client, project_id, jobs, results)
 
-                if missed_nodes:
-                    logger.warning(f"Nodes requested but NOT found in '{pipe_name}': {missed_nodes}")
-                    if args.debug and flow_data:
-                        dump_failed_flow(flow_data, pipe_name, pid, "partial_miss")
 
-                elif applied_changes:
-                    client.upload_pipeline_flow(processor.flow, project_id, pid)
-                    if args.validate:
-                        validate_pipeline_changes(client, project_id, pid, applied_changes)
+def run_rules_scenario(args, client: Client, project_id: str):
+    logger.info(f"Starting RULES scenario with rules file: {args.rules_file}")
 
-                else:
-                    logger.info(f"No nodes matched or updated in pipeline '{pipe_name}'.")
-                    if args.debug and flow_data:
-                        dump_failed_flow(flow_data, pipe_name, pid, "no_matches")
+    rules = parse_rules_file(args.rules_file)
+    if not rules:
+        logger.error("No valid rules found in the rules file.")
+        sys.exit(1)
+    logger.info(f"Loaded {len(rules)} rules.")
 
-            except Exception as e:
-                logger.error(f"Failed to process pipeline '{pipe_name}': {e}", exc_info=True)
-                if args.debug and flow_data:
-                    dump_failed_flow(flow_data, pipe_name, pid, "error")
+    pipelines = client.list_pipelines(project_id)
+    if args.pipeline_name:
+        pipelines = [p for p in pipelines if p["name"] == args.pipeline_name]
+        if not pipelines:
+            logger.error(f"Pipeline '{args.pipeline_name}' not found in project.")
+            sys.exit(1)
 
-    else:
-        logger.info(f"Updating ALL pipelines with value: {args.sender_value}")
-        pipelines = client.list_pipelines(project_id)
+    jobs = [(p["name"], p["id"], rules, set()) for p in pipelines]
+    run_jobs_and_report(args, client, project_id, jobs, defaultdict(list))
 
-        global_updates_map = {None: args.sender_value}
 
-        for p in pipelines:
-            flow_data = None
-            try:
-                logger.info(f"Checking pipeline: {p['name']}")
-                flow_data = client.get_pipeline_flow(project_id, p['id'])
-                processor = PipelineProcessor(flow_data)
+def run_jobs_and_report(args, client: Client, project_id: str, jobs: List[tuple],
+                        results: Dict[str, List[str]]):
+    validator = ChangeValidator(client, project_id) if args.validate else None
 
-                applied_changes = processor.update_send_email_nodes(global_updates_map)
+    for status, names in run_pipeline_jobs(args, client, project_id, jobs, validator).items():
+        results[status].extend(names)
 
-                if applied_changes:
-                    client.upload_pipeline_flow(processor.flow, project_id, p['id'])
-                    if args.validate:
-                        validate_pipeline_changes(client, project_id, p['id'], applied_changes)
-                else:
-                    logger.info(f"No 'Send email' nodes found in '{p['name']}'.")
-                    if args.debug and flow_data:
-                        dump_failed_flow(flow_data, p['name'], p['id'], "no_email_nodes")
+    if validator:
+        mismatched = validator.report()
+        if mismatched:
+            results["validation_mismatch"] = mismatched
 
-            except Exception as e:
-                logger.error(f"Error processing pipeline {p['name']}: {e}", exc_info=True)
-                if args.debug and flow_data:
-                    dump_failed_flow(flow_data, p['name'], p['id'], "error")
+    log_summary(results)
 
 
-def run_pipeline_scenario(args, client: CPDClient, project_id: str):
+def run_pipeline_scenario(args, client: Client, project_id: str):
     logger.info(f"Starting PIPELINE scenario for '{args.pipeline_name}'")
 
     all_pipelines = client.list_pipelines(project_id)
@@ -535,6 +1242,7 @@ def run_pipeline_scenario(args, client: CPDClient, project_id: str):
         sys.exit(1)
 
     global_updates_map = {None: args.sender_value}
+    validator = ChangeValidator(client, project_id) if args.validate else None
 
     for target in targets:
         flow_data = None
@@ -545,10 +1253,12 @@ def run_pipeline_scenario(args, client: CPDClient, project_id: str):
 
             applied_changes = processor.update_send_email_nodes(global_updates_map)
 
-            if applied_changes:
+            if not applied_changes and processor.unchanged:
+                logger.info(f"Pipeline '{target['name']}' already up to date, skipping upload.")
+            elif applied_changes:
                 client.upload_pipeline_flow(processor.flow, project_id, target['id'])
-                if args.validate:
-                    validate_pipeline_changes(client, project_id, target['id'], applied_changes)
+                if validator:
+                    validator.submit(target['name'], target['id'], processor.applied)
             else:
                 logger.warning(f"No 'Send email' nodes updated in pipeline '{target['name']}'.")
                 if args.debug and flow_data:
@@ -559,17 +1269,37 @@ def run_pipeline_scenario(args, client: CPDClient, project_id: str):
             if args.debug and flow_data:
                 dump_failed_flow(flow_data, target['name'], target['id'], "error")
 
+    if validator:
+        validator.report()
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Update 'sender' parameter in Notification activities.")
 
     parent_parser = argparse.ArgumentParser(add_help=False)
-    parent_parser.add_argument("--host", required=True, help="CPD Host URL")
-    parent_parser.add_argument("--username", required=True, help="Username")
-    parent_parser.add_argument("--password", required=True, help="Password")
+    parent_parser.add_argument("--host", help="CPD Host URL")
+    parent_parser.add_argument("--username", help="Username")
+    parent_parser.add_argument("--password", help="Password")
     parent_parser.add_argument("--project-name", required=True, help="Project Name")
     parent_parser.add_argument("--debug", action="store_true", help="Enable detailed debug logging and file output.")
-    parent_parser.add_argument("--validate", action="store_true", help="Validate changes after upload.")
+    parent_parser.add_argument("--validate", action="store_true",
+                               help="Re-fetch uploaded pipelines in the background and verify the new sender values.")
+    parent_parser.add_argument("--backend", choices=["http", "cpdctl"], default="http",
+                               help="Call the CPD APIs over HTTP (default) or through the cpdctl CLI.")
+    parent_parser.add_argument("--cache-dir", help="Directory in which downloaded flows are cached between runs.")
+    parent_parser.add_argument("--cache-max-mb", type=positive_int, default=DEFAULT_CACHE_MAX_MB,
+                               help="Size limit of the flows in --cache-dir, least recently used flows are evicted.")
+    parent_parser.add_argument("--offline", action="store_true",
+                               help="Plan and report the updates from --cache-dir only, nothing is uploaded.")
+    parent_parser.add_argument("--max-host-requests", type=positive_int, default=DEFAULT_MAX_HOST_REQUESTS,
+                               help="Maximum number of concurrent requests sent to the host.")
 
     subparsers = parser.add_subparsers(dest="scenario", required=True, title="Scenarios")
 
@@ -578,13 +1308,35 @@ def parse_args():
     proj_group = proj_parser.add_mutually_exclusive_group(required=True)
     proj_group.add_argument("--sender-value", help="Global value for all nodes.")
     proj_group.add_argument("--path", help="CSV file mapping: pipeline,node,value")
+    proj_parser.add_argument("--workers", type=positive_int, default=1,
+                             help="Number of pipelines processed concurrently (default 1).")
 
     pipe_parser = subparsers.add_parser("pipeline", parents=[parent_parser],
                                         help="Update single pipeline.")
     pipe_parser.add_argument("--pipeline-name", required=True, help="Pipeline Name")
     pipe_parser.add_argument("--sender-value", required=True, help="New sender value")
 
-    return parser.parse_args()
+    rules_parser = subparsers.add_parser("rules", parents=[parent_parser],
+                                         help="Apply input update rules from a CSV or YAML file.")
+    rules_parser.add_argument("--rules-file", required=True,
+                              help="CSV or YAML file with node_type,name_pattern,input_name,value_template")
+    rules_parser.add_argument("--pipeline-name", help="Only update this pipeline.")
+    rules_parser.add_argument("--workers", type=positive_int, default=1,
+                              help="Number of pipelines processed concurrently (default 1).")
+
+    args = parser.parse_args()
+
+    if args.offline:
+        if not args.cache_dir:
+            parser.error("--offline requires --cache-dir")
+        if args.validate:
+            parser.error("--validate cannot be combined with --offline")
+    else:
+        missing = [f"--{name}" for name in ("host", "username", "password") if not getattr(args, name)]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+
+    return args
 
 
 def setup_debug_logging(args):
@@ -629,7 +1381,7 @@ def main():
 
     try:
         logger.info("Initializing CPD Client...")
-        client = CPDClient(args.host, args.username, args.password)
+        client = create_client(args)
 
         logger.info(f"Resolving project ID for '{args.project_name}'...")
         project_id = client.get_project_id(args.project_name)
@@ -642,6 +1394,8 @@ def main():
             run_project_scenario(args, client, project_id)
         elif args.scenario == "pipeline":
             run_pipeline_scenario(args, client, project_id)
+        elif args.scenario == "rules":
+            run_rules_scenario(args, client, project_id)
 
     except KeyboardInterrupt:
         logger.warning("Operation cancelled by user.")